@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'nutrition.apps.NutritionConfig',
     'products.apps.ProductsConfig',
     'recipes.apps.RecipesConfig',
+    'search.apps.SearchConfig',
 
     # Сторонние приложения
     'django_celery_results',
@@ -85,11 +86,46 @@ WSGI_APPLICATION = 'calorizator.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Режим хранения выбирается переменной окружения DB_ENGINE:
+#  sqlite (по умолчанию) - SQLite в режиме WAL, подходит для нескольких воркеров на одной машине
+#  postgresql - PostgreSQL с постоянными соединениями
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'calorizator'),
+            'USER': os.environ.get('DB_USER', 'calorizator'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # время жизни соединения в секундах, соединение переиспользуется между задачами
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            # через pgbouncer в режиме transaction серверные курсоры (.iterator()) недоступны
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER') == '1',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'main.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # сколько секунд ждать снятия блокировки другим писателем
+                'timeout': int(os.environ.get('SQLITE_TIMEOUT', 30)),
+            },
+        }
     }
+
+# PRAGMA, которые выполняются при открытии каждого соединения с SQLite (main.backends.sqlite3)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,
+    'foreign_keys': 'ON',
 }
 
 
@@ -133,6 +169,9 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# медиафайлы хранятся по хэшу содержимого, одинаковые изображения не дублируются
+DEFAULT_FILE_STORAGE = 'main.storage.ContentAddressedStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -142,3 +181,86 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379'
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# Parser settings
+# максимальное количество одновременных запросов к одному хосту
+PARSER_REQUESTS_PER_HOST = 8
+# размер пула соединений общей HTTP-сессии
+PARSER_POOL_SIZE = 16
+# количество повторов запроса и множитель задержки между ними
+PARSER_RETRIES = 3
+PARSER_BACKOFF_FACTOR = 0.5
+# таймаут запроса (подключение, чтение) в секундах
+PARSER_TIMEOUT = (5, 30)
+# продукты, обновленные за это количество часов, не парсятся повторно при парсинге рецептов
+PARSER_PRODUCT_FRESHNESS_HOURS = 24
+# компоненты, обновленные за это количество часов, не парсятся повторно при парсинге продуктов
+PARSER_COMPONENT_FRESHNESS_HOURS = 24 * 7
+# ограничение частоты запросов к одному хосту: запросов в секунду и сколько можно выполнить подряд
+PARSER_RATE_LIMIT = 5
+PARSER_RATE_BURST = 10
+# redis для ограничителя, общего для всех воркеров (None - ограничение в памяти процесса)
+PARSER_RATE_LIMIT_REDIS_URL = CELERY_BROKER_URL
+# максимальная пауза после ответов 429/5xx в секундах
+PARSER_MAX_BACKOFF = 300
+# окно коммита парсеров: сколько сущностей (рецептов, продуктов, компонентов) записывать
+#  в одной транзакции и сколько мс сущность может ждать записи (None - без ограничения по времени)
+PARSER_COMMIT_SIZE = 1
+PARSER_COMMIT_INTERVAL_MS = None
+# ссылки на рецепты, переданные воркерам, повторно раздаются только через это количество минут
+#  (если их парсинг не завершился, например, из-за ошибки или остановки воркера)
+PARSER_DISPATCH_TIMEOUT_MINUTES = 60
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# кэш ответов API для рецептов и продуктов: в памяти процесса или общий в redis (API_CACHE_REDIS_URL)
+#  ответ возвращается, только если не изменились времена обновления объекта и связанных с ним строк
+API_CACHE = 'api'
+API_CACHE_TIMEOUT = 60 * 60 * 24
+if os.environ.get('API_CACHE_REDIS_URL'):
+    CACHES[API_CACHE] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ['API_CACHE_REDIS_URL'],
+        'TIMEOUT': API_CACHE_TIMEOUT,
+    }
+else:
+    CACHES[API_CACHE] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'TIMEOUT': API_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+
+# Admin settings
+# таблицы, в которых по оценке больше строк, в списках админки не подсчитываются точно
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Refresh settings
+# размер пачки при обходе устаревших записей
+REFRESH_BATCH_SIZE = 100
+
+# API settings
+# количество объектов на странице списка по умолчанию и максимальное
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+# ограничения калькулятора пищевой ценности: наборов и продуктов во всех наборах в одном запросе
+NUTRITION_MAX_PLANS = 10000
+NUTRITION_MAX_ITEMS = 200000
+# наибольший вес продукта в наборе в граммах, чтобы суммы не переполнялись
+NUTRITION_MAX_WEIGHT = 10 ** 6
+
+# Search settings
+# размер страницы результатов поиска по умолчанию и максимальный
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# размер пачки при индексации
+SEARCH_BATCH_SIZE = 500
@@ -15,12 +15,17 @@ Including another URLconf
 """
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
 from calorizator import settings
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/recipes/', include('recipes.urls')),
+    path('api/products/', include('products.urls')),
+    path('api/components/', include('components.urls')),
+    path('api/nutrition/', include('nutrition.urls')),
+    path('api/search/', include('search.urls')),
 ]
 
 if settings.DEBUG:
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from main.admin import CoreModelAdmin
 from .models import Element, Addon, Vitamin
 
 
@@ -9,19 +10,20 @@ class ComponentAdmin:
         'id',
         'updated',
     ]
-    filter_horizontal = ['products']
+    search_fields = ['title']
+    autocomplete_fields = ['products']
 
 
 @admin.register(Element)
-class ElementAdmin(ComponentAdmin, admin.ModelAdmin):
+class ElementAdmin(ComponentAdmin, CoreModelAdmin):
     pass
 
 
 @admin.register(Addon)
-class AddonAdmin(ComponentAdmin, admin.ModelAdmin):
+class AddonAdmin(ComponentAdmin, CoreModelAdmin):
     pass
 
 
 @admin.register(Vitamin)
-class VitaminAdmin(ComponentAdmin, admin.ModelAdmin):
+class VitaminAdmin(ComponentAdmin, CoreModelAdmin):
     pass
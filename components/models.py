@@ -12,6 +12,7 @@ class Component(CoreModel):
     url = models.CharField(
         'URL',
         max_length=150,
+        unique=True,
     )
     title = models.CharField(
         'Название',
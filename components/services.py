@@ -1,92 +1,147 @@
-import datetime
-import re
+from functools import partial
 
-import requests
-from bs4 import BeautifulSoup
-from django.core.files.base import ContentFile
+from django.utils import timezone
 
 from components.models import Vitamin, Element, Addon
-from recipes import services
+from main.batching import CommitWindow
+from main.cache import invalidate_payloads
+from main.extract import Field, Schema, get_attr, get_joined_text
+from main.fetch import Fetcher, save_validators_on_commit
+from main.services import iter_stale_batches
+
+# описание компонента или продукта - текст заголовков и абзацев блока
+DESCRIPTION_XPATH = 'descendant::*[contains(local-name(), "h3") or contains(local-name(), "p")]'
+
+COMPONENT_SCHEMA = Schema(
+    title=Field(css='h1'),
+    photo_src=Field(
+        css='p.rtecenter img',
+        getter=get_attr('src'),
+        process=lambda src: 'https:' + src,
+    ),
+    description=Field(
+        css='div.node-content',
+        getter=get_joined_text(DESCRIPTION_XPATH),
+        default='',
+    ),
+)
 
 
 class ComponentParser:
     """
     Парсер компонентов
     """
-    def __init__(self, component_urls, product=None):
+    def __init__(self, component_urls, product=None, freshness=None, seen=None):
+        """
+        :param freshness: timedelta, компоненты обновленные за этот период не парсятся повторно
+        :param seen: множество url-адресов компонентов, уже обработанных в текущем запуске
+        """
         self.component_urls = component_urls
         self.product = product
-        self.session = requests.Session()
+        self.freshness = freshness
+        self.seen = seen if seen is not None else set()
+        self.fetcher = Fetcher()
+        self.window = CommitWindow()
 
     def main(self):
         """
         Основной метод, определяет работу класса
         """
-        for c in self.component_urls:
-            url, title, photo_src, description = self.parse(c)
-
-            if not photo_src:
-                continue
+        component_urls = self.get_stale_urls(self.component_urls)
+        self.fetcher.prefetch(component_urls, conditional=True)
+        try:
+            for c in component_urls:
+                parsed = self.parse(c)
+                self.seen.add(c)
+                if parsed is None:
+                    continue
+
+                url, title, photo_src, description, validators = parsed
+
+                if not photo_src:
+                    continue
+
+                # фото загружаем до начала транзакции
+                photo = self.fetcher.get_file(photo_src, title + '.jpg')
+                self.window.entity(
+                    partial(self.save, url, title, photo, description, validators),
+                    key=url,
+                )
+        finally:
+            self.window.commit()
 
-            self.update_or_create_object(
-                url=url,
-                title=title,
-                photo_src=photo_src,
-                description=description,
-            )
         if self.product:
             self.add_components(self.product, self.component_urls)
 
-    def get_soup(self, url):
+    def get_stale_urls(self, component_urls):
         """
-        Возвращает объект BeautifulSoup для заданного url
+        Возвращает url-адреса компонентов, которые нужно парсить:
+         без уже обработанных в текущем запуске и без свежих (обновленных за self.freshness)
         """
-        r = self.session.get(url)
-        return BeautifulSoup(r.text, 'lxml')
+        urls = [u for u in dict.fromkeys(component_urls) if u not in self.seen]
+        if self.freshness and urls:
+            fresh = set()
+            for model, model_urls in self.group_by_model(urls).items():
+                fresh.update(model.objects.filter(
+                    url__in=model_urls,
+                    updated__gte=timezone.now() - self.freshness,
+                ).values_list('url', flat=True))
+            self.seen.update(fresh)
+            urls = [u for u in urls if u not in fresh]
+        return urls
 
     def parse(self, url):
         """
         Парсит страницу продукта и создает объекты соответствующей модели
-        """
-        soup = self.get_soup(url)
-        title = services.get_text_element(soup, 'h1')
-        try:
-            photo_src = 'https:' + services.get_image_src(soup, 'p.rtecenter img')
-        except TypeError:
-            photo_src = None
-        description = self.get_description(
-            soup,
-            'div.node-content',
-        )
-        return url, title, photo_src, description
 
-    @staticmethod
-    def get_description(soup, selector):
+        Возвращает (url, название, ссылка на фото, описание, валидаторы ответа),
+         либо None, если страница не изменилась с прошлого парсинга
         """
-        Из объекта BeautifulSoup возвращает описание продукта
+        # отложенные сущности не должны ждать записи все время загрузок этой
+        self.window.commit_if_expired()
+        tree, validators = self.fetcher.get_page(url, conditional=True)
+        if tree is None:
+            # страница не изменилась, достаточно обновить отметку времени компонента
+            model = self.get_component_model(url)
+            if model.objects.filter(url=url).update(updated=timezone.now()):
+                return None
+            tree, validators = self.fetcher.get_page(url)
+
+        data = COMPONENT_SCHEMA.extract(tree)
+        return url, data['title'], data['photo_src'], data['description'], validators
+
+    def save(self, url, title, photo, description, validators):
         """
-        description = ''
-        description_elems = soup.select_one(selector).find_all(re.compile('h3|p'))
-        for d in description_elems:
-            description += d.text
-        return description
+        Записывает компонент, отложенный в окне коммита
 
-    def update_or_create_object(self, url, title, photo_src, description):
+        :param validators: валидаторы ответа страницы компонента (Fetcher.get_page)
+        """
+        self.update_or_create_object(
+            url=url,
+            title=title,
+            photo=photo,
+            description=description,
+        )
+        # валидаторы страницы сохраняются, только если компонент записан
+        save_validators_on_commit(url, validators)
+
+    def update_or_create_object(self, url, title, photo, description):
         """
         Создает/обновляет объекты соответствующей модели
+
+        :param photo: имя сохраненного фото (Fetcher.get_file)
         """
         model = self.get_component_model(url)
-        model.objects.update_or_create(
+        component, _ = model.objects.update_or_create(
             url=url,
             defaults={
                 'title': title,
-                'photo': ContentFile(
-                    self.session.get(photo_src).content,
-                    name=title + '.jpg',
-                ),
+                'photo': photo,
                 'description': description,
             },
         )
+        # компоненты входят в ответ API продуктов
+        invalidate_payloads('product', component.products.values_list('id', flat=True))
 
     @staticmethod
     def get_component_model(component_url):
@@ -100,32 +155,46 @@ class ComponentParser:
         elif '/addon/' in component_url:
             return Addon
 
+    @classmethod
+    def group_by_model(cls, component_urls):
+        """
+        Группирует url-адреса компонентов по моделям
+        """
+        groups = {}
+        for url in component_urls:
+            model = cls.get_component_model(url)
+            if model is not None:
+                groups.setdefault(model, []).append(url)
+        return groups
+
     def add_components(self, product, component_urls):
         """
         Добавляет компоненты продукту
+
+        Связи записываются в промежуточные таблицы пачкой, уже существующие пропускаются
         """
-        model = self.get_component_model(component_urls[0])
-        components = model.objects.filter(url__in=component_urls)
-        if model == Vitamin:
-            product.vitamin_set.add(*components)
-        if model == Element:
-            product.element_set.add(*components)
-        if model == Addon:
-            product.addon_set.add(*components)
+        for model, urls in self.group_by_model(component_urls).items():
+            through = model.products.through
+            component_field = model._meta.model_name + '_id'
+            component_ids = model.objects.filter(url__in=urls).values_list('id', flat=True)
+            through.objects.bulk_create(
+                [through(**{component_field: i, 'product_id': product.pk}) for i in component_ids],
+                ignore_conflicts=True,
+            )
+        invalidate_payloads('product', [product.pk])
 
 
 def update_components(model, number, days):
     """
     Обновляет информацию о компонентах хранящихся в базе
 
-    :param number: количество элементов обновляемых за один раз
+    :param number: количество элементов обновляемых за один раз, None - все устаревшие
     :param days: количество дней с последнего обновления
     """
-    components = model.objects.filter(
-        updated__lt=datetime.datetime.now() - datetime.timedelta(days=days)
-    )[:number].values_list('url', flat=True)
-    parser = ComponentParser(components)
-    parser.main()
+    name = 'components.' + model.__name__
+    for batch in iter_stale_batches(model.objects.all(), name, days, number, ['url']):
+        parser = ComponentParser([c['url'] for c in batch])
+        parser.main()
 
 
 def update_vitamins(number, days):
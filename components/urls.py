@@ -0,0 +1,13 @@
+from django.urls import path
+
+from components import views
+from components.models import Addon, Element, Vitamin
+
+app_name = 'components'
+
+urlpatterns = []
+for prefix, model in (('vitamins', Vitamin), ('elements', Element), ('addons', Addon)):
+    urlpatterns += [
+        path(f'{prefix}/', views.component_list, {'model': model}, name=f'{model._meta.model_name}_list'),
+        path(f'{prefix}/<int:pk>/', views.component_detail, {'model': model}, name=f'{model._meta.model_name}_detail'),
+    ]
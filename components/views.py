@@ -1,3 +1,30 @@
-from django.shortcuts import render
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from main.api import ApiField, Serializer, detail_view, get_file_url, get_related_links, list_view
+
+COMPONENT_SERIALIZER = Serializer(
+    id=ApiField(lambda c: c.id),
+    url=ApiField(lambda c: c.url),
+    title=ApiField(lambda c: c.title),
+    description=ApiField(lambda c: c.description),
+    photo=ApiField(lambda c: get_file_url(c.photo)),
+    # у распространенных компонентов тысячи продуктов, поэтому возвращаются только их id
+    products=ApiField(lambda c: [p.id for p in c.products.all()], prefetch_related=['products']),
+    created=ApiField(lambda c: c.created),
+    updated=ApiField(lambda c: c.updated),
+)
+
+
+def get_version_fields(model):
+    # связь с продуктом (add_components) не меняет время обновления компонента
+    return ('updated', *get_related_links(model.products.through, model._meta.model_name))
+
+
+@require_GET
+def component_list(request, model):
+    return list_view(request, model.objects.all(), COMPONENT_SERIALIZER, get_version_fields(model))
+
+
+@require_GET
+def component_detail(request, model, pk):
+    return detail_view(request, model.objects.all(), COMPONENT_SERIALIZER, pk, get_version_fields(model))
@@ -1,3 +1,62 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 
-# Register your models here.
+from .models import RefreshCheckpoint
+
+
+def get_estimated_count(model):
+    """
+    Возвращает примерное количество строк таблицы модели без полного подсчета, либо None
+
+    В PostgreSQL берется из статистики планировщика, в SQLite - максимальный id
+     (точно, если строки не удалялись)
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            pk = model._meta.pk.column
+            cursor.execute(f'SELECT MAX("{pk}") FROM "{table}"')
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который для больших таблиц без фильтров не выполняет COUNT(*)
+
+    Если количество строк по оценке больше ADMIN_ESTIMATED_COUNT_THRESHOLD,
+     используется оценка, иначе - точный подсчет
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = get_estimated_count(queryset.model)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class CoreModelAdmin(admin.ModelAdmin):
+    """
+    Админка для больших таблиц: без полного подсчета строк на каждой странице списка
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(RefreshCheckpoint)
+class RefreshCheckpointAdmin(admin.ModelAdmin):
+    list_display = [
+        'name',
+        'last_updated',
+        'last_id',
+        'updated',
+    ]
@@ -0,0 +1,239 @@
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, DateTimeField, IntegerField, Max, OuterRef, Subquery
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from main.cache import get_payloads, set_payloads
+
+
+# наибольший id (bigint): большие значения не помещаются в параметры запросов к базе
+MAX_ID = 2 ** 63 - 1
+
+
+def get_positive_int(value, default, maximum=MAX_ID):
+    """
+    Возвращает положительное целое число из параметра запроса (не больше maximum), либо default
+    """
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(value, maximum) if value > 0 else default
+
+
+def get_file_url(file):
+    """
+    Возвращает url файла, либо None, если файла нет
+    """
+    return file.url if file else None
+
+
+class ApiField:
+    """
+    Поле ответа API
+
+    :param getter: функция, получающая значение поля из объекта
+    :param select_related: связи, которые нужно загрузить тем же запросом (select_related)
+    :param prefetch_related: связи, которые нужно загрузить отдельными запросами (prefetch_related)
+    """
+    def __init__(self, getter, select_related=(), prefetch_related=()):
+        self.getter = getter
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+
+
+class Serializer:
+    """
+    Набор полей ответа API для объектов модели
+
+    Связи загружаются только для выбранных полей, поэтому количество запросов
+     не зависит от количества объектов
+    """
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def get_fields(self, names=None):
+        """
+        Возвращает выбранные поля по строке вида "id,title" (None - все поля)
+
+        Если поле неизвестно, выбрасывает ValueError
+        """
+        if not names:
+            return self.fields
+        fields = {}
+        for name in names.split(','):
+            name = name.strip()
+            if name not in self.fields:
+                raise ValueError(f'Неизвестное поле: {name}')
+            fields[name] = self.fields[name]
+        return fields
+
+    @staticmethod
+    def prepare(queryset, fields):
+        """
+        Добавляет к queryset загрузку связей, нужных для полей fields
+        """
+        select_related = [lookup for field in fields.values() for lookup in field.select_related]
+        prefetch_related = [lookup for field in fields.values() for lookup in field.prefetch_related]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    @staticmethod
+    def serialize(obj, fields):
+        return {name: field.getter(obj) for name, field in fields.items()}
+
+
+def get_related_updated(model, field, lookup='updated'):
+    """
+    Возвращает подзапрос для version_fields: наибольшее время обновления lookup
+     среди строк model, связанных с объектом через поле field
+
+    Нужен, когда в ответ входят данные связанных объектов (например, название продукта
+     в ингредиентах рецепта): их изменение не меняет время обновления самого объекта
+    """
+    return Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(value=Max(lookup))
+        .values('value'),
+        output_field=DateTimeField(),
+    )
+
+
+def get_related_links(model, field):
+    """
+    Возвращает подзапросы для version_fields: количество и наибольший id строк
+     промежуточной таблицы model, связанных с объектом через поле field
+
+    У строк промежуточной таблицы нет времени обновления: новая связь меняет
+     наибольший id, а удаленная - количество
+    """
+    links = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return (
+        Subquery(links.annotate(value=Count('id')).values('value'), output_field=IntegerField()),
+        Subquery(links.annotate(value=Max('id')).values('value'), output_field=IntegerField()),
+    )
+
+
+def get_version(rows, *params):
+    """
+    Возвращает ETag и время последнего изменения для строк [(id, updated, ...)]
+
+    ETag зависит от id и всех времен обновления, а также от параметров запроса params,
+     влияющих на содержимое ответа
+    """
+    timestamps = [value for row in rows for value in row[1:] if isinstance(value, datetime.datetime)]
+    # If-Modified-Since передается с точностью до секунды, как и Last-Modified
+    last_modified = int(max(timestamps).timestamp()) if timestamps else None
+    digest = hashlib.md5(repr((rows, params)).encode()).hexdigest()
+    return digest, last_modified
+
+
+def versioned_response(request, rows, build, *params):
+    """
+    Возвращает ответ с заголовками ETag и Last-Modified
+
+    Если у клиента актуальная версия (If-None-Match/If-Modified-Since), возвращается 304,
+     а build (функция, создающая данные ответа) не вызывается
+    """
+    etag, last_modified = get_version(rows, *params)
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def serialize_rows(queryset, serializer, rows, fields, cache_kind=None):
+    """
+    Возвращает данные объектов страницы [(id, updated, ...)] в порядке rows
+
+    Если задан cache_kind, ответы берутся из кэша (main.cache), а недостающие
+     сериализуются со всеми полями и сохраняются в кэш
+    """
+    if cache_kind is None:
+        objects = serializer.prepare(queryset.filter(id__in=[row[0] for row in rows]), fields)
+        payloads = {obj.id: serializer.serialize(obj, fields) for obj in objects}
+        return [payloads[row[0]] for row in rows if row[0] in payloads]
+
+    versions = {row[0]: row[1:] for row in rows}
+    payloads = get_payloads(cache_kind, versions)
+    missing = [pk for pk in versions if pk not in payloads]
+    if missing:
+        all_fields = serializer.fields
+        objects = serializer.prepare(queryset.filter(id__in=missing), all_fields)
+        fresh = {obj.id: serializer.serialize(obj, all_fields) for obj in objects}
+        # версия прочитана до загрузки объектов, поэтому более новые данные
+        #  могут сохраниться со старой версией, но не наоборот
+        set_payloads(cache_kind, {pk: (versions[pk], payload) for pk, payload in fresh.items()})
+        payloads.update(fresh)
+    return [
+        {name: payloads[row[0]][name] for name in fields}
+        for row in rows
+        if row[0] in payloads
+    ]
+
+
+def list_view(request, queryset, serializer, version_fields=('updated',), cache_kind=None):
+    """
+    Список объектов с постраничной навигацией по ключу
+
+    Параметры запроса:
+     after - id последнего объекта предыдущей страницы (из поля next ответа)
+     limit - количество объектов на странице
+     fields - поля объектов через запятую
+
+    Сначала одним запросом выбираются id и время обновления объектов страницы
+     (version_fields), и только если у клиента нет актуальной версии,
+     загружаются сами объекты со связями (или берутся из кэша, если задан cache_kind)
+    """
+    try:
+        fields = serializer.get_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    after = get_positive_int(request.GET.get('after'), 0)
+    limit = min(get_positive_int(request.GET.get('limit'), settings.API_PAGE_SIZE), settings.API_MAX_PAGE_SIZE)
+
+    # запрашиваем на одну запись больше, чтобы узнать, есть ли следующая страница
+    rows = list(
+        queryset.filter(id__gt=after).order_by('id').values_list('id', *version_fields)[:limit + 1]
+    )
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    def build():
+        return {
+            'results': serialize_rows(queryset, serializer, rows, fields, cache_kind),
+            'next': rows[-1][0] if has_next else None,
+        }
+    return versioned_response(request, rows, build, list(fields), has_next)
+
+
+def detail_view(request, queryset, serializer, pk, version_fields=('updated',), cache_kind=None):
+    """
+    Объект с id pk
+
+    Параметр запроса fields - поля объекта через запятую
+    """
+    try:
+        fields = serializer.get_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    rows = list(queryset.filter(id=pk).values_list('id', *version_fields)) if pk <= MAX_ID else []
+    if not rows:
+        raise Http404
+
+    def build():
+        return serialize_rows(queryset, serializer, rows, fields, cache_kind)[0]
+    return versioned_response(request, rows, build, list(fields))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite, настроенный для нескольких параллельных писателей (celery-воркеров)
+
+    - на каждом соединении выполняются SQLITE_PRAGMAS (режим WAL и т.д.)
+    - транзакции начинаются с BEGIN IMMEDIATE: блокировка на запись берется
+       сразу и ожидается в пределах timeout, а не падает с "database is locked"
+       при попытке повысить блокировку посреди транзакции
+    """
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,86 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+
+class CommitWindow:
+    """
+    Окно коммита для записей парсеров
+
+    Запись сущности (например, рецепта с тегами, пунктами и ингредиентами) передается
+     в entity() функцией и откладывается. Накопленные записи выполняются в commit()
+     одной короткой транзакцией, каждая в своей точке сохранения. Окно фиксируется
+     после size сущностей или если первая отложенная сущность ждет дольше interval мс,
+     что сокращает количество fsync. Время проверяется при добавлении сущности и в
+     commit_if_expired(), который парсеры вызывают перед загрузками следующей сущности,
+     поэтому сущность ждет записи не дольше interval мс плюс загрузки одной сущности.
+
+    Загрузка страниц и файлов следующих сущностей идет вне транзакции, поэтому
+     блокировка записи (BEGIN IMMEDIATE в SQLite) не удерживается во время HTTP-запросов
+
+    Если запись сущности завершилась ошибкой, откатывается только эта сущность,
+     а остальные фиксируются
+
+    :param size: количество сущностей в одной транзакции
+    :param interval: сколько мс сущность может ждать записи (None - без ограничения)
+    :param on_error: функция (key, исключение), вызывается при ошибке записи сущности;
+     если не задана, ошибка выбрасывается из commit() после фиксации остальных сущностей
+    """
+    def __init__(self, size=None, interval=None, on_error=None):
+        self.size = size or settings.PARSER_COMMIT_SIZE
+        self.interval = interval if interval is not None else settings.PARSER_COMMIT_INTERVAL_MS
+        self.on_error = on_error
+        self.entities = []
+        self.started = None
+
+    def entity(self, write, key=None):
+        """
+        Откладывает запись одной сущности
+
+        :param write: функция без аргументов, выполняющая все записи сущности
+        :param key: объект, который передается в on_error при ошибке записи
+        """
+        if not self.entities:
+            self.started = time.monotonic()
+        self.entities.append((key, write))
+        if len(self.entities) >= self.size or self.is_expired():
+            self.commit()
+
+    def is_expired(self):
+        """
+        Проверяет, не пора ли записать отложенные сущности по времени
+        """
+        if self.interval is None or not self.entities:
+            return False
+        return (time.monotonic() - self.started) * 1000 >= self.interval
+
+    def commit_if_expired(self):
+        """
+        Записывает отложенные сущности, если они ждут дольше interval мс
+        """
+        if self.is_expired():
+            self.commit()
+
+    def commit(self):
+        """
+        Записывает отложенные сущности в одной транзакции
+        """
+        entities, self.entities = self.entities, []
+        if not entities:
+            return
+
+        errors = []
+        with transaction.atomic():
+            for key, write in entities:
+                try:
+                    # точка сохранения, чтобы при ошибке откатить только эту сущность
+                    with transaction.atomic():
+                        write()
+                except Exception as e:
+                    errors.append((key, e))
+
+        for key, e in errors:
+            if self.on_error is None:
+                raise e
+            self.on_error(key, e)
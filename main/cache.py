@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def get_payload_cache():
+    return caches[settings.API_CACHE]
+
+
+def get_payload_key(kind, pk):
+    return f'{kind}:{pk}'
+
+
+def get_payloads(kind, versions):
+    """
+    Возвращает сохраненные в кэше ответы API {id: данные}
+
+    :param kind: тип объектов (recipe, product)
+    :param versions: {id: версия}, версия - времена обновления объекта и связанных с ним строк
+     (version_fields представлений API)
+
+    Ответ сохраняется вместе с версией, и если объект или связанные с ним строки
+     с тех пор обновились, устаревший ответ не возвращается. Поэтому кэш в памяти
+     процесса безопасен, даже когда данные меняют парсеры в других процессах
+    """
+    keys = {get_payload_key(kind, pk): pk for pk in versions}
+    payloads = {}
+    for key, (version, payload) in get_payload_cache().get_many(keys).items():
+        pk = keys[key]
+        if version == versions[pk]:
+            payloads[pk] = payload
+    return payloads
+
+
+def set_payloads(kind, payloads):
+    """
+    Сохраняет ответы API в кэше
+
+    :param payloads: {id: (версия, данные)}
+    """
+    get_payload_cache().set_many(
+        {get_payload_key(kind, pk): value for pk, value in payloads.items()},
+        timeout=settings.API_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_payloads(kind, ids):
+    """
+    Удаляет ответы API объектов ids из кэша после коммита текущей транзакции
+
+    Вызывается при записи парсеров, чтобы устаревшие ответы не занимали место
+     в общем кэше (redis). Актуальность ответов от этого не зависит: ее проверяет
+     версия (get_payloads), а до кэшей в памяти других процессов удаление не доходит
+    """
+    keys = [get_payload_key(kind, pk) for pk in ids]
+    if keys:
+        transaction.on_commit(lambda: get_payload_cache().delete_many(keys))
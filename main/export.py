@@ -0,0 +1,103 @@
+import csv
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def to_flat_value(value):
+    """
+    Приводит значение к виду для табличных форматов: вложенные списки и словари - в JSON
+    """
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return value
+
+
+class JsonLinesWriter:
+    """
+    Запись объектов в JSON Lines: один объект на строку, вложенные данные как есть
+    """
+    binary = False
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+
+    def write(self, rows):
+        for row in rows:
+            self.stream.write(json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+class CsvWriter:
+    """
+    Запись объектов в CSV: вложенные данные записываются в столбцы как JSON
+    """
+    binary = False
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, fieldnames=fields)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(
+            {name: self.to_csv_value(value) for name, value in row.items()}
+            for row in rows
+        )
+
+    @staticmethod
+    def to_csv_value(value):
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        return to_flat_value(value)
+
+    def close(self):
+        self.stream.flush()
+
+
+class ParquetWriter:
+    """
+    Запись объектов в Parquet (нужен pyarrow): каждая пачка записывается отдельной группой строк
+
+    Схема определяется по первой пачке, вложенные данные записываются как JSON
+    """
+    binary = True
+
+    def __init__(self, stream, fields):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        self.stream = stream
+        self.fields = fields
+        self.schema = None
+        self.writer = None
+
+    def write(self, rows):
+        columns = {name: [to_flat_value(row[name]) for row in rows] for name in self.fields}
+        if self.writer is None:
+            table = self.pyarrow.table(columns)
+            # столбцы, в которых в первой пачке только None, считаем строковыми
+            self.schema = self.pyarrow.schema([
+                (field.name, self.pyarrow.string() if self.pyarrow.types.is_null(field.type) else field.type)
+                for field in table.schema
+            ])
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.stream, self.schema)
+        self.writer.write_table(self.pyarrow.table(columns, schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            # пустая выгрузка: файл только со схемой
+            schema = self.pyarrow.schema([(name, self.pyarrow.string()) for name in self.fields])
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.stream, schema)
+        self.writer.close()
+
+
+WRITERS = {
+    'jsonl': JsonLinesWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
@@ -0,0 +1,105 @@
+from cssselect import HTMLTranslator
+from lxml import etree
+
+
+def get_text(element):
+    """
+    Возвращает текст элемента без пробельных символов по краям
+    """
+    return element.text_content().strip()
+
+
+def get_raw_text(element):
+    """
+    Возвращает текст элемента как есть
+    """
+    return element.text_content()
+
+
+def get_tail(element):
+    """
+    Возвращает текст, следующий сразу за элементом
+    """
+    return (element.tail or '').strip()
+
+
+def get_attr(name):
+    """
+    Возвращает функцию, получающую значение атрибута name элемента
+    """
+    def getter(element):
+        return element.get(name)
+    return getter
+
+
+def get_joined_text(xpath):
+    """
+    Возвращает функцию, склеивающую текст потомков элемента, найденных по xpath
+    """
+    selector = etree.XPath(xpath)
+
+    def getter(element):
+        return ''.join(e.text_content() for e in selector(element))
+    return getter
+
+
+def compile_selector(css=None, xpath=None):
+    """
+    Компилирует css-селектор или xpath-выражение в объект XPath
+    """
+    if css is not None:
+        xpath = HTMLTranslator().css_to_xpath(css)
+    return etree.XPath(xpath)
+
+
+class Field:
+    """
+    Описание поля страницы
+
+    :param css: css-селектор элемента (переводится в xpath один раз при создании поля)
+    :param xpath: xpath-выражение, если css не задан
+    :param getter: функция, получающая значение из найденного элемента
+    :param many: вернуть значения всех найденных элементов, а не только первого
+    :param process: функция постобработки полученного значения (не вызывается для None)
+    :param default: значение, если элемент не найден
+    """
+    def __init__(self, css=None, xpath=None, getter=get_text, many=False, process=None, default=None):
+        self.css = css
+        self.selector = compile_selector(css, xpath)
+        self.getter = getter
+        self.many = many
+        self.process = process
+        self.default = default
+
+    def extract(self, tree):
+        """
+        Возвращает значение поля для дерева lxml
+        """
+        elements = self.selector(tree)
+        if self.many:
+            value = [self.getter(e) for e in elements]
+        elif elements:
+            value = self.getter(elements[0])
+        else:
+            return self.default
+
+        if self.process is not None and value is not None:
+            value = self.process(value)
+        return value
+
+
+class Schema:
+    """
+    Набор полей страницы определенного типа
+
+    Селекторы компилируются при создании схемы, а extract выполняет их
+     напрямую на дереве lxml.html
+    """
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def extract(self, tree):
+        """
+        Возвращает словарь {имя поля: значение}
+        """
+        return {name: field.extract(tree) for name, field in self.fields.items()}
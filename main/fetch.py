@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from lxml import html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from main.models import FetchedUrl
+from main.ratelimit import RETRY_STATUSES, get_rate_limiter
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """
+    HTTP-сессия с пулом соединений, повторами и таймаутом по умолчанию
+
+    Сессия повторяет запросы только при сетевых ошибках, ответы 429/5xx
+     повторяет Fetcher с учетом ограничителя частоты запросов
+    """
+    def __init__(self, pool_size, retries, backoff_factor, timeout):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                allowed_methods=frozenset(['GET', 'HEAD']),
+            ),
+        )
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(*args, **kwargs)
+
+
+def get_session():
+    """
+    Возвращает общую для процесса HTTP-сессию
+
+    Сессия создается один раз и используется всеми парсерами, поэтому
+     keep-alive соединения живут все время работы процесса (celery-воркера)
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = PooledSession(
+                    pool_size=settings.PARSER_POOL_SIZE,
+                    retries=settings.PARSER_RETRIES,
+                    backoff_factor=settings.PARSER_BACKOFF_FACTOR,
+                    timeout=settings.PARSER_TIMEOUT,
+                )
+    return _session
+
+
+def reset_session():
+    """
+    Сбрасывает общую сессию
+
+    Вызывается в дочернем процессе после fork (prefork-пул celery),
+     чтобы процессы не делили сокеты родителя
+    """
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_session)
+
+
+def get_url_key(url):
+    """
+    Возвращает ключ записи FetchedUrl для url
+    """
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+def get_validators(urls):
+    """
+    Возвращает сохраненные валидаторы (ETag, Last-Modified) ответов для urls одним запросом
+
+    Возвращает {url: {'etag', 'last_modified'}}, url без валидаторов не попадают в результат
+    """
+    keys = {get_url_key(url): url for url in urls}
+    rows = FetchedUrl.objects.filter(key__in=keys).exclude(etag='', last_modified='')
+    return {
+        keys[key]: {'etag': etag, 'last_modified': last_modified}
+        for key, etag, last_modified in rows.values_list('key', 'etag', 'last_modified')
+    }
+
+
+def get_response_validators(response):
+    """
+    Возвращает валидаторы успешного ответа {'etag', 'last_modified'}, либо None
+    """
+    if response.status_code != 200:
+        return None
+    validators = {
+        'etag': response.headers.get('ETag') or '',
+        'last_modified': response.headers.get('Last-Modified') or '',
+    }
+    return validators if any(validators.values()) else None
+
+
+def save_validators(url, validators, **fields):
+    """
+    Сохраняет валидаторы ответа (get_response_validators) для последующих условных запросов
+
+    :param fields: другие поля FetchedUrl, например имя сохраненного файла
+    """
+    if validators or fields:
+        FetchedUrl.objects.update_or_create(key=get_url_key(url), defaults={**(validators or {}), **fields})
+
+
+def save_validators_on_commit(url, validators):
+    """
+    Сохраняет валидаторы страницы после коммита текущей транзакции
+
+    Вызывается там же, где записываются данные со страницы: если запись откатится,
+     валидаторы не сохранятся, и следующий запрос получит страницу целиком, а не 304
+    """
+    if validators:
+        transaction.on_commit(lambda: save_validators(url, validators))
+
+
+def get_conditional_headers(validators):
+    """
+    Возвращает заголовки If-None-Match/If-Modified-Since для условного запроса по валидаторам
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+class Fetcher:
+    """
+    Загрузчик страниц для парсеров
+
+    Умеет заранее параллельно загружать пачку url-адресов (prefetch),
+     не превышая per_host одновременных запросов к одному хосту.
+    Загруженные ответы отдаются через get/get_page, а то, чего нет в буфере,
+     загружается синхронно.
+
+    При conditional=True запрос отправляется с сохраненными валидаторами,
+     и если страница не изменилась, сервер отвечает 304 без тела
+    """
+    def __init__(self, session=None, per_host=None, limiter=None):
+        self.session = session or get_session()
+        self.limiter = limiter or get_rate_limiter()
+        self.per_host = per_host or settings.PARSER_REQUESTS_PER_HOST
+        self.buffer = {}
+
+    def prefetch(self, urls, conditional=False):
+        """
+        Параллельно загружает url-адреса в буфер
+        """
+        urls = [u for u in dict.fromkeys(urls) if u and u not in self.buffer]
+        if urls:
+            # валидаторы читаем заранее одним запросом, потоки загрузки к базе не обращаются
+            validators = get_validators(urls) if conditional else {}
+            headers = {url: get_conditional_headers(validators.get(url, {})) for url in urls}
+            self.buffer.update(asyncio.run(self._fetch_all(urls, headers)))
+
+    async def _fetch_all(self, urls, headers):
+        """
+        Загружает url-адреса в пуле потоков, ограничивая число запросов к хосту семафором
+        """
+        loop = asyncio.get_running_loop()
+        semaphores = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        hosts = {urlsplit(u).netloc for u in urls}
+
+        with ThreadPoolExecutor(max_workers=self.per_host * len(hosts)) as executor:
+            async def fetch(url):
+                async with semaphores[urlsplit(url).netloc]:
+                    return await loop.run_in_executor(executor, self.send, url, headers[url])
+
+            responses = await asyncio.gather(
+                *(fetch(u) for u in urls),
+                return_exceptions=True,
+            )
+
+        # неудачные запросы не кладем в буфер, они повторятся синхронно в get
+        return {
+            url: response for url, response in zip(urls, responses)
+            if not isinstance(response, Exception)
+        }
+
+    def request(self, url, conditional=False, **kwargs):
+        """
+        Выполняет HTTP-запрос, при conditional=True - условный
+        """
+        headers = None
+        if conditional:
+            headers = get_conditional_headers(get_validators([url]).get(url, {}))
+        return self.send(url, headers, **kwargs)
+
+    def send(self, url, headers=None, **kwargs):
+        """
+        Выполняет HTTP-запрос с заголовками headers
+
+        Каждый запрос проходит через ограничитель частоты запросов к хосту,
+         после ответов 429/5xx запрос повторяется с паузой. Если и после повторов
+         ответ не 200/304, выбрасывает requests.HTTPError
+        """
+        host = urlsplit(url).netloc
+        for _ in range(settings.PARSER_RETRIES + 1):
+            self.limiter.acquire(host)
+            response = self.session.get(url, headers=headers, **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                self.limiter.success(host)
+                break
+            self.limiter.backoff(host, response)
+
+        # после последнего повтора ошибка не должна выглядеть как ответ с содержимым страницы
+        if response.status_code not in (200, 304):
+            response.close()
+            raise requests.HTTPError(f'{response.status_code} для {url}', response=response)
+        return response
+
+    def get(self, url, conditional=False):
+        """
+        Возвращает ответ для url из буфера, либо загружает его
+        """
+        response = self.buffer.pop(url, None)
+        # ответ 304 из буфера не подходит, если нужно тело страницы
+        if response is None or (response.status_code == 304 and not conditional):
+            response = self.request(url, conditional)
+        return response
+
+    def get_page(self, url, conditional=False):
+        """
+        Возвращает дерево lxml.html для заданного url и валидаторы ответа
+
+        Если запрос условный и страница не изменилась, вместо дерева возвращает None.
+        Валидаторы не сохраняются: их сохраняет парсер после записи данных страницы
+         (save_validators_on_commit)
+        """
+        response = self.get(url, conditional)
+        if response.status_code == 304:
+            return None, None
+        tree = html.document_fromstring(
+            response.content,
+            parser=html.HTMLParser(encoding=response.encoding),
+        )
+        return tree, get_response_validators(response)
+
+    def get_file(self, url, name):
+        """
+        Загружает файл по url в хранилище и возвращает имя сохраненного файла,
+         которое можно присвоить полю FileField/ImageField
+
+        Если файл с этого url уже сохранялся и сервер ответил 304,
+         повторная загрузка не выполняется. Валидаторы сохраняются сразу,
+         так как файл уже записан в хранилище
+        """
+        stored = FetchedUrl.objects.filter(key=get_url_key(url)).exclude(file='').values_list(
+            'file', flat=True,
+        ).first()
+
+        response = self.get(url, conditional=stored is not None)
+        if response.status_code == 304:
+            if default_storage.exists(stored):
+                return stored
+            response = self.get(url)
+        # в хранилище попадает только содержимое успешного ответа, а не страница ошибки
+        if response.status_code != 200:
+            raise requests.HTTPError(f'{response.status_code} для {url}', response=response)
+
+        stored = default_storage.save(name, ContentFile(response.content))
+        save_validators(url, get_response_validators(response), file=stored)
+        return stored
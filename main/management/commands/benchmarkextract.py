@@ -0,0 +1,80 @@
+import time
+
+from bs4 import BeautifulSoup
+from django.core.management import BaseCommand
+from lxml import html
+
+from components.services import COMPONENT_SCHEMA
+from main.fetch import get_session
+from products.services import PRODUCT_SCHEMA
+from recipes.services import RECIPE_SCHEMA, get_image_src, get_text_element
+
+SCHEMAS = {
+    'recipe': RECIPE_SCHEMA,
+    'product': PRODUCT_SCHEMA,
+    'component': COMPONENT_SCHEMA,
+}
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает скорость извлечения полей страницы через скомпилированную схему (lxml)
+     и через BeautifulSoup (get_text_element/get_image_src)
+    """
+    help = 'Сравнивает скорость извлечения полей схемой и через BeautifulSoup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('page_type', choices=SCHEMAS.keys())
+        parser.add_argument('sources', nargs='+', help='Файлы или url-адреса страниц')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        schema = SCHEMAS[options['page_type']]
+        pages = [self.load(s) for s in options['sources']]
+        repeat = options['repeat']
+
+        legacy = self.measure(lambda page: self.extract_legacy(schema, page), pages, repeat)
+        compiled = self.measure(lambda page: schema.extract(html.document_fromstring(page)), pages, repeat)
+
+        self.stdout.write(f'BeautifulSoup: {legacy * 1000:.2f} мс на страницу')
+        self.stdout.write(f'Схема (lxml):  {compiled * 1000:.2f} мс на страницу')
+        self.stdout.write(f'Ускорение:     {legacy / compiled:.1f}x')
+
+    @staticmethod
+    def load(source):
+        """
+        Возвращает html страницы из файла или по url
+        """
+        if source.startswith(('http://', 'https://')):
+            return get_session().get(source).content
+        with open(source, 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def extract_legacy(schema, page):
+        """
+        Извлекает поля схемы по их css-селекторам прежним способом через BeautifulSoup
+        """
+        soup = BeautifulSoup(page, 'lxml')
+        data = {}
+        for name, field in schema.fields.items():
+            if field.css is None:
+                continue
+            if field.many:
+                data[name] = soup.select(field.css)
+            elif name.endswith('_src'):
+                data[name] = get_image_src(soup, field.css)
+            else:
+                data[name] = get_text_element(soup, field.css)
+        return data
+
+    @staticmethod
+    def measure(extract, pages, repeat):
+        """
+        Возвращает среднее время извлечения полей одной страницы в секундах
+        """
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page in pages:
+                extract(page)
+        return (time.perf_counter() - start) / (repeat * len(pages))
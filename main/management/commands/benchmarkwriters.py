@@ -0,0 +1,74 @@
+import multiprocessing
+import time
+
+from django.core.management import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+
+from main.models import RefreshCheckpoint
+
+# префикс записей, которые создает бенчмарк
+NAME_PREFIX = 'benchmark-'
+
+
+def write(worker, writes):
+    """
+    Выполняет writes коротких пишущих транзакций, как это делают парсеры (update_or_create)
+
+    Возвращает количество ошибок блокировки базы
+    """
+    errors = 0
+    for i in range(writes):
+        try:
+            with transaction.atomic():
+                RefreshCheckpoint.objects.update_or_create(
+                    name=f'{NAME_PREFIX}{worker}-{i % 10}',
+                    defaults={'last_id': i},
+                )
+        except OperationalError:
+            errors += 1
+    connection.close()
+    return errors
+
+
+class Command(BaseCommand):
+    """
+    Измеряет пропускную способность базы при нескольких параллельных писателях
+
+    Каждый процесс моделирует celery-воркер, выполняющий короткие пишущие транзакции
+    """
+    help = 'Измеряет скорость записи в базу несколькими процессами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--writes', type=int, default=500, help='Транзакций на процесс')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        writes = options['writes']
+
+        # дочерние процессы не должны использовать соединение родителя
+        connections.close_all()
+        start = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            errors = sum(pool.starmap(write, [(w, writes) for w in range(workers)]))
+        elapsed = time.perf_counter() - start
+
+        RefreshCheckpoint.objects.filter(name__startswith=NAME_PREFIX).delete()
+
+        total = workers * writes
+        self.stdout.write(f'Режим: {self.get_mode()}')
+        self.stdout.write(f'Процессов: {workers}, транзакций: {total}, ошибок блокировки: {errors}')
+        self.stdout.write(f'Время: {elapsed:.2f} с, {(total - errors) / elapsed:.0f} транзакций/с')
+
+    @staticmethod
+    def get_mode():
+        """
+        Возвращает описание текущего режима хранения
+        """
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+            return f'SQLite, journal_mode={journal_mode}'
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        return f'{connection.vendor}, CONN_MAX_AGE={conn_max_age}'
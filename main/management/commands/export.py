@@ -0,0 +1,154 @@
+import datetime
+from functools import reduce
+from operator import or_
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from components.models import Addon, Element, Vitamin
+from components.views import COMPONENT_SERIALIZER
+from main.api import ApiField, Serializer
+from main.export import WRITERS
+from main.utils import chunked
+from products.models import Product
+from products.views import PRODUCT_SERIALIZER, PRODUCT_VERSION_FIELDS
+from recipes.models import Recipe
+from recipes.views import RECIPE_SERIALIZER, RECIPE_VERSION_FIELDS
+
+COMPONENT_RELATIONS = {
+    'vitamins': 'vitamin_set',
+    'elements': 'element_set',
+    'addons': 'addon_set',
+}
+
+
+def get_recipe_components(recipe):
+    """
+    Возвращает id компонентов всех продуктов рецепта {vitamins, elements, addons}
+    """
+    components = {name: set() for name in COMPONENT_RELATIONS}
+    for ingredient in recipe.ingredient_set.all():
+        for name, relation in COMPONENT_RELATIONS.items():
+            components[name].update(c.id for c in getattr(ingredient.product, relation).all())
+    return {name: sorted(ids) for name, ids in components.items()}
+
+
+# рецепты выгружаются как в API и дополнительно с компонентами продуктов
+RECIPE_EXPORT_SERIALIZER = Serializer(
+    **RECIPE_SERIALIZER.fields,
+    components=ApiField(
+        get_recipe_components,
+        prefetch_related=[f'ingredient_set__product__{relation}' for relation in COMPONENT_RELATIONS.values()],
+    ),
+)
+
+# тип объектов: модель, сериализатор и поля версии, как в API (учитываются в --since)
+ENTITIES = {
+    'recipes': (Recipe, RECIPE_EXPORT_SERIALIZER, RECIPE_VERSION_FIELDS),
+    'products': (Product, PRODUCT_SERIALIZER, PRODUCT_VERSION_FIELDS),
+    'vitamins': (Vitamin, COMPONENT_SERIALIZER, ('updated',)),
+    'elements': (Element, COMPONENT_SERIALIZER, ('updated',)),
+    'addons': (Addon, COMPONENT_SERIALIZER, ('updated',)),
+}
+
+
+class Command(BaseCommand):
+    """
+    Выгружает рецепты, продукты или компоненты в JSON Lines, CSV или Parquet
+
+    Объекты читаются пачками: id перебираются курсором (.iterator()), а каждая пачка
+     загружается со всеми связями (prefetch_related), поэтому память не зависит
+     от объема данных. С --since выгружаются только изменения
+    """
+    help = 'Выгружает данные в JSON Lines, CSV или Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=ENTITIES.keys())
+        parser.add_argument('--format', choices=WRITERS.keys(), default='jsonl')
+        parser.add_argument('--output', help='Файл (по умолчанию - stdout)')
+        parser.add_argument(
+            '--since',
+            help='Только объекты, обновленные начиная с этого времени (ISO 8601)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        model, serializer, version_fields = ENTITIES[options['entity']]
+        writer_class = WRITERS[options['format']]
+        if writer_class.binary and not options['output']:
+            raise CommandError(f'Для формата {options["format"]} нужно указать --output')
+
+        queryset = model.objects.all()
+        since = self.parse_since(options['since'])
+        if since is not None:
+            queryset = self.filter_since(queryset, version_fields, since)
+
+        # объекты, измененные во время выгрузки, попадут и в следующую
+        started = timezone.now()
+        if not options['output']:
+            stream = self.stdout
+        elif writer_class.binary:
+            stream = open(options['output'], 'wb')
+        else:
+            stream = open(options['output'], 'w', newline='', encoding='utf-8')
+        try:
+            count = self.export(queryset, serializer, writer_class, stream, options['chunk_size'])
+        finally:
+            if options['output']:
+                stream.close()
+
+        self.stderr.write(f'Выгружено: {count}. Следующая выгрузка изменений: --since {started.isoformat()}')
+
+    @staticmethod
+    def export(queryset, serializer, writer_class, stream, chunk_size):
+        try:
+            writer = writer_class(stream, list(serializer.fields))
+        except ImportError:
+            raise CommandError('Для выгрузки в Parquet нужно установить pyarrow')
+
+        count = 0
+        ids = queryset.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+        for chunk in chunked(ids, chunk_size):
+            objects = serializer.prepare(queryset.model.objects.filter(id__in=chunk).order_by('id'), serializer.fields)
+            rows = [serializer.serialize(obj, serializer.fields) for obj in objects]
+            writer.write(rows)
+            count += len(rows)
+        writer.close()
+        return count
+
+    @staticmethod
+    def filter_since(queryset, version_fields, since):
+        """
+        Оставляет объекты, у которых хотя бы одно из времен обновления version_fields
+         не раньше since
+
+        Вложенные данные (пищевая ценность, названия продуктов в ингредиентах)
+         обновляются отдельно от объекта, поэтому в version_fields есть и подзапросы
+         (main.api.get_related_updated), они фильтруются через аннотации
+        """
+        conditions = []
+        for i, field in enumerate(version_fields):
+            if not isinstance(field, str):
+                queryset = queryset.annotate(**{f'version_{i}': field})
+                field = f'version_{i}'
+            conditions.append(Q(**{f'{field}__gte': since}))
+        return queryset.filter(reduce(or_, conditions))
+
+    @staticmethod
+    def parse_since(value):
+        """
+        Возвращает время из --since (дата или дата со временем), либо None
+        """
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            date = parse_date(value)
+            if date is None:
+                raise CommandError(f'Некорректное время: {value}')
+            since = datetime.datetime.combine(date, datetime.time())
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
@@ -0,0 +1,336 @@
+import json
+import os
+import shutil
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from components.models import Addon, Element, Vitamin
+from main.utils import chunked
+from nutrition.models import ProductNutrition, RecipeNutrition
+from nutrition.services import update_recipe_nutrition
+from products.models import Ingredient, Product
+from recipes.models import NUTRITION_FIELDS, Recipe, RecipePhotoStep, RecipeReference, Tag
+from search.services import rebuild_search_index
+
+COMPONENT_FILES = {
+    'vitamins': Vitamin,
+    'elements': Element,
+    'addons': Addon,
+}
+
+# модели, время обновления которых берется из снимка (при создании им передаются get_dates)
+DATED_MODELS = (
+    Recipe, Product, ProductNutrition, Ingredient, RecipeNutrition, Vitamin, Element, Addon,
+)
+
+
+@contextmanager
+def keep_updated(*models):
+    """
+    Отключает auto_now у поля updated, чтобы сохранить время обновления из снимка
+
+    Иначе bulk_create записал бы текущее время, и все объекты выглядели бы свежими
+     для парсеров и выгрузки изменений (export --since)
+    """
+    fields = [model._meta.get_field('updated') for model in models]
+    for field in fields:
+        field.auto_now = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now = True
+
+
+def iter_jsonl(path):
+    """
+    Построчно читает объекты из файла JSON Lines, если файла нет - ничего не возвращает
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def get_file_name(url):
+    """
+    Возвращает имя файла в хранилище по его url из выгрузки
+    """
+    if not url:
+        return ''
+    if url.startswith(settings.MEDIA_URL):
+        return url[len(settings.MEDIA_URL):]
+    return url
+
+
+def get_dates(row):
+    return {
+        'created': parse_datetime(row['created']),
+        'updated': parse_datetime(row['updated']),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Загружает снимок данных, выгруженный командой export, без парсинга сайта
+
+    Снимок - каталог с файлами recipes.jsonl, products.jsonl, vitamins.jsonl,
+     elements.jsonl, addons.jsonl и каталогом media (копия MEDIA_ROOT).
+
+    Объекты создаются через bulk_create в порядке зависимостей
+     (ссылки и рецепты -> продукты и их пищевая ценность -> компоненты и связи ->
+     ингредиенты и пищевая ценность рецептов), каждая пачка в своей транзакции.
+     id рецептов, продуктов и компонентов сохраняются. Уже существующие строки
+     пропускаются, поэтому прерванную загрузку можно повторить с --resume
+    """
+    help = 'Загружает снимок данных, выгруженный командой export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Каталог снимка')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить прерванную загрузку в непустую базу',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isdir(path):
+            raise CommandError(f'Каталог не найден: {path}')
+        if not options['resume'] and (Recipe.objects.exists() or Product.objects.exists()):
+            raise CommandError('База не пустая: снимок загружается в новую базу (или с --resume)')
+
+        self.batch_size = options['batch_size']
+        self.counts = Counter()
+
+        def read(name):
+            return iter_jsonl(os.path.join(path, f'{name}.jsonl'))
+
+        with keep_updated(*DATED_MODELS):
+            self.load_batches(read('recipes'), self.load_recipes)
+            self.load_batches(read('products'), self.load_products)
+            for name, model in COMPONENT_FILES.items():
+                self.load_batches(read(name), lambda rows: self.load_components(model, rows))
+            # ингредиенты ссылаются на продукты, поэтому загружаются вторым проходом
+            self.load_batches(read('recipes'), self.load_ingredients)
+
+        self.reset_sequences()
+        self.counts['media'] = self.copy_media(os.path.join(path, 'media'))
+
+        # bulk_create не вызывает сигналы, поэтому индекс поиска строится целиком
+        rebuild_search_index()
+        caches[settings.API_CACHE].clear()
+
+        for name, count in self.counts.items():
+            self.stdout.write(f'{name}: {count}')
+
+    def load_batches(self, rows, load):
+        for batch in chunked(rows, self.batch_size):
+            with transaction.atomic():
+                load(batch)
+
+    def load_recipes(self, rows):
+        """
+        Создает ссылки на рецепты, рецепты, теги и пункты рецептов с фото
+        """
+        urls = [row['url'] for row in rows]
+        RecipeReference.objects.bulk_create(
+            [RecipeReference(url=url, is_parsed=True) for url in urls],
+            ignore_conflicts=True,
+        )
+        RecipeReference.objects.filter(url__in=urls, is_parsed=False).update(is_parsed=True)
+        reference_ids = dict(RecipeReference.objects.filter(url__in=urls).values_list('url', 'id'))
+
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    id=row['id'],
+                    reference_id=reference_ids[row['url']],
+                    title=row['title'],
+                    description=row['description'],
+                    instruction=row['instruction'],
+                    author=row['author'],
+                    serving=row['serving'],
+                    photo=get_file_name(row['photo']),
+                    card=get_file_name(row['card']),
+                    **get_dates(row),
+                )
+                for row in rows
+            ],
+            ignore_conflicts=True,
+        )
+
+        # теги создаются в порядке появления в снимке, чтобы сохранить их порядок в рецептах
+        titles = list(dict.fromkeys(title for row in rows for title in row['tags']))
+        Tag.objects.bulk_create([Tag(title=title) for title in titles], ignore_conflicts=True)
+        tag_ids = dict(Tag.objects.filter(title__in=titles).values_list('title', 'id'))
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            [through(recipe_id=row['id'], tag_id=tag_ids[title]) for row in rows for title in row['tags']],
+            ignore_conflicts=True,
+        )
+
+        # у пунктов нет уникального ключа: при повторной загрузке пропускаем рецепты, у которых они уже есть
+        loaded = set(
+            RecipePhotoStep.objects.filter(recipe_id__in=[row['id'] for row in rows])
+            .values_list('recipe_id', flat=True)
+        )
+        RecipePhotoStep.objects.bulk_create([
+            RecipePhotoStep(recipe_id=row['id'], title=step['title'], photo=get_file_name(step['photo']))
+            for row in rows
+            if row['id'] not in loaded
+            for step in row['steps']
+        ])
+        self.counts['recipes'] += len(rows)
+
+    def load_products(self, rows):
+        """
+        Создает продукты и их пищевую ценность
+        """
+        Product.objects.bulk_create(
+            [
+                Product(
+                    id=row['id'],
+                    url=row['url'],
+                    title=row['title'],
+                    description=row['description'],
+                    photo=get_file_name(row['photo']),
+                    **get_dates(row),
+                )
+                for row in rows
+            ],
+            ignore_conflicts=True,
+        )
+        ProductNutrition.objects.bulk_create(
+            [
+                ProductNutrition(product_id=row['id'], **row['nutrition'], **get_dates(row))
+                for row in rows
+                if row['nutrition']
+            ],
+            ignore_conflicts=True,
+        )
+        self.counts['products'] += len(rows)
+
+    def load_components(self, model, rows):
+        """
+        Создает компоненты модели model и их связи с продуктами
+        """
+        model.objects.bulk_create(
+            [
+                model(
+                    id=row['id'],
+                    url=row['url'],
+                    title=row['title'],
+                    description=row['description'],
+                    photo=get_file_name(row['photo']),
+                    **get_dates(row),
+                )
+                for row in rows
+            ],
+            ignore_conflicts=True,
+        )
+        product_ids = set(
+            Product.objects.filter(id__in={pk for row in rows for pk in row['products']})
+            .values_list('id', flat=True)
+        )
+        through = model.products.through
+        component_field = model._meta.model_name + '_id'
+        through.objects.bulk_create(
+            [
+                through(**{component_field: row['id'], 'product_id': product_id})
+                for row in rows
+                for product_id in row['products']
+                if product_id in product_ids
+            ],
+            ignore_conflicts=True,
+        )
+        self.counts[model._meta.verbose_name_plural] += len(rows)
+
+    def load_ingredients(self, rows):
+        """
+        Создает ингредиенты и пищевую ценность рецептов
+        """
+        recipe_ids = [row['id'] for row in rows]
+        loaded = set(Ingredient.objects.filter(recipe_id__in=recipe_ids).values_list('recipe_id', flat=True))
+        product_ids = set(
+            Product.objects.filter(
+                id__in={i['product_id'] for row in rows for i in row['ingredients']},
+            ).values_list('id', flat=True)
+        )
+        ingredients = [
+            Ingredient(
+                recipe_id=row['id'],
+                product_id=ingredient['product_id'],
+                measure=ingredient['measure'],
+                weight=ingredient['weight'],
+                **get_dates(row),
+            )
+            for row in rows
+            if row['id'] not in loaded
+            for ingredient in row['ingredients']
+            if ingredient['product_id'] in product_ids
+        ]
+        Ingredient.objects.bulk_create(ingredients)
+
+        nutrition = []
+        missing = []
+        for row in rows:
+            if not row['nutrition']:
+                missing.append(row['id'])
+                continue
+            values = {field: row['nutrition']['total'][field] for field in NUTRITION_FIELDS}
+            values.update({
+                field + '_per_serving': row['nutrition']['per_serving'][field]
+                for field in NUTRITION_FIELDS
+            })
+            nutrition.append(RecipeNutrition(recipe_id=row['id'], **values, **get_dates(row)))
+        RecipeNutrition.objects.bulk_create(nutrition, ignore_conflicts=True)
+        if missing:
+            update_recipe_nutrition(missing)
+        self.counts['ingredients'] += len(ingredients)
+
+    @staticmethod
+    def reset_sequences():
+        """
+        Сдвигает счетчики id таблиц, строки которых созданы с id из снимка
+
+        Иначе в PostgreSQL первая же новая запись (парсером или в админке) получила бы
+         уже занятый id. В SQLite счетчик сдвигается сам, и запросов нет
+        """
+        sql = connection.ops.sequence_reset_sql(no_style(), [Recipe, Product, *COMPONENT_FILES.values()])
+        if sql:
+            with connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
+
+    @staticmethod
+    def copy_media(source):
+        """
+        Копирует файлы снимка в MEDIA_ROOT, существующие файлы не перезаписываются
+
+        Имена файлов - хэши содержимого (main.storage), поэтому одинаковое имя
+         означает одинаковый файл
+        """
+        if not os.path.isdir(source):
+            return 0
+        copied = 0
+        for directory, _, files in os.walk(source):
+            target_directory = os.path.join(settings.MEDIA_ROOT, os.path.relpath(directory, source))
+            for name in files:
+                target = os.path.join(target_directory, name)
+                if os.path.exists(target):
+                    continue
+                os.makedirs(target_directory, exist_ok=True)
+                shutil.copy2(os.path.join(directory, name), target)
+                copied += 1
+        return copied
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from search.services import DOCUMENTS, rebuild_search_index
+
+
+class Command(BaseCommand):
+    """
+    Строит полнотекстовый индекс заново
+
+    Нужен после первого развертывания поиска и после загрузки данных
+     в обход моделей (bulk_create не вызывает сигналы)
+    """
+    help = 'Строит полнотекстовый индекс заново'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', choices=list(DOCUMENTS), help='Типы документов')
+
+    def handle(self, *args, **options):
+        rebuild_search_index(options['kinds'])
@@ -14,8 +14,73 @@ class CoreModel(models.Model):
         'Обновлено',
         null=False,
         auto_now=True,
+        db_index=True,
     )
 
     class Meta:
         abstract = True
         ordering = ['-updated']
+
+
+class RefreshCheckpoint(CoreModel):
+    """
+    Позиция, на которой остановилось обновление устаревших записей (main.services.iter_stale_batches)
+    """
+    name = models.CharField(
+        'Название',
+        max_length=100,
+        unique=True,
+    )
+    last_updated = models.DateTimeField(
+        'Время обновления последней записи',
+        blank=True,
+        null=True,
+    )
+    last_id = models.BigIntegerField(
+        'Id последней записи',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = 'Позиция обновления'
+        verbose_name_plural = 'Позиции обновления'
+
+    def __str__(self):
+        return self.name
+
+
+class FetchedUrl(models.Model):
+    """
+    Валидаторы ответа (ETag, Last-Modified) и имя сохраненного файла для url (main.fetch)
+
+    Запись ищется по хэшу url через уникальный индекс, поэтому чтение и запись
+     не зависят от количества сохраненных url-адресов
+    """
+    key = models.CharField(
+        'Хэш url',
+        max_length=40,
+        unique=True,
+    )
+    etag = models.CharField(
+        'ETag',
+        max_length=255,
+        blank=True,
+    )
+    last_modified = models.CharField(
+        'Last-Modified',
+        max_length=64,
+        blank=True,
+    )
+    file = models.CharField(
+        'Имя сохраненного файла',
+        max_length=255,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Загруженный url'
+        verbose_name_plural = 'Загруженные url'
+
+    def __str__(self):
+        return self.key
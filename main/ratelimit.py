@@ -0,0 +1,229 @@
+import logging
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# ответы, после которых нужно замедлиться и повторить запрос
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+# Token bucket в redis: возвращает 0, если токен получен,
+#  иначе сколько миллисекунд нужно подождать
+TOKEN_BUCKET_SCRIPT = """
+local blocked = redis.call('PTTL', KEYS[2])
+if blocked > 0 then
+    return blocked
+end
+
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+
+local wait = 0
+if tokens < 1 then
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+def get_retry_after(response):
+    """
+    Возвращает значение заголовка Retry-After в секундах, либо None
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов к хосту (token bucket)
+
+    :param rate: количество запросов в секунду к одному хосту
+    :param burst: максимальное количество запросов, которое можно выполнить подряд без ожидания
+    :param max_backoff: максимальная пауза после ответов 429/5xx, секунды
+    """
+    def __init__(self, rate, burst, max_backoff):
+        self.rate = rate
+        self.burst = burst
+        self.max_backoff = max_backoff
+        # количество неудачных ответов подряд для хоста
+        self.failures = {}
+
+    def reserve(self, host):
+        """
+        Пытается получить токен для хоста, возвращает время ожидания в секундах (0 - токен получен)
+        """
+        raise NotImplementedError
+
+    def block(self, host, delay):
+        """
+        Запрещает запросы к хосту на delay секунд
+        """
+        raise NotImplementedError
+
+    def acquire(self, host):
+        """
+        Ожидает, пока к хосту можно будет выполнить запрос
+        """
+        while True:
+            wait = self.reserve(host)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def backoff(self, host, response):
+        """
+        Замедляет запросы к хосту после ответа 429/5xx
+
+        Пауза берется из Retry-After, а если его нет - удваивается с каждым
+         неудачным ответом подряд
+        """
+        failures = self.failures.get(host, 0) + 1
+        self.failures[host] = failures
+        delay = get_retry_after(response)
+        if delay is None:
+            delay = settings.PARSER_BACKOFF_FACTOR * 2 ** (failures - 1)
+        delay = min(delay, self.max_backoff)
+        logger.warning('%s ответил %s, пауза %.1f с', host, response.status_code, delay)
+        self.block(host, delay)
+
+    def success(self, host):
+        """
+        Сбрасывает счетчик неудачных ответов хоста
+        """
+        self.failures.pop(host, None)
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Ограничитель частоты запросов в памяти процесса
+
+    Подходит для запуска в одном процессе и для тестов
+    """
+    def __init__(self, rate, burst, max_backoff):
+        super().__init__(rate, burst, max_backoff)
+        self.lock = threading.Lock()
+        # host: (количество токенов, время последнего пополнения)
+        self.buckets = {}
+        # host: время, до которого запросы запрещены
+        self.blocked = {}
+
+    def reserve(self, host):
+        with self.lock:
+            now = time.monotonic()
+            blocked = self.blocked.get(host, 0) - now
+            if blocked > 0:
+                return blocked
+
+            tokens, ts = self.buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - ts) * self.rate)
+            wait = 0
+            if tokens < 1:
+                wait = (1 - tokens) / self.rate
+            else:
+                tokens -= 1
+            self.buckets[host] = (tokens, now)
+            return wait
+
+    def block(self, host, delay):
+        with self.lock:
+            until = time.monotonic() + delay
+            self.blocked[host] = max(self.blocked.get(host, 0), until)
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Ограничитель частоты запросов в redis, общий для всех воркеров
+
+    Если redis недоступен, временно используется ограничитель в памяти процесса
+    """
+    def __init__(self, url, rate, burst, max_backoff):
+        super().__init__(rate, burst, max_backoff)
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.fallback = MemoryRateLimiter(rate, burst, max_backoff)
+        self.available = True
+
+    @staticmethod
+    def get_keys(host):
+        return [f'ratelimit:{host}:bucket', f'ratelimit:{host}:blocked']
+
+    def reserve(self, host):
+        try:
+            wait = self.script(keys=self.get_keys(host), args=[self.rate, self.burst])
+        except (redis.ConnectionError, redis.TimeoutError):
+            if self.available:
+                logger.warning('Redis недоступен, частота запросов ограничивается в памяти процесса')
+                self.available = False
+            return self.fallback.reserve(host)
+        self.available = True
+        return wait / 1000
+
+    def block(self, host, delay):
+        self.fallback.block(host, delay)
+        try:
+            self.client.set(self.get_keys(host)[1], 1, px=max(1, int(delay * 1000)))
+        except (redis.ConnectionError, redis.TimeoutError):
+            pass
+
+
+def get_rate_limiter():
+    """
+    Возвращает общий для процесса ограничитель частоты запросов
+
+    Если задан PARSER_RATE_LIMIT_REDIS_URL, ограничение общее для всех воркеров
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                options = {
+                    'rate': settings.PARSER_RATE_LIMIT,
+                    'burst': settings.PARSER_RATE_BURST,
+                    'max_backoff': settings.PARSER_MAX_BACKOFF,
+                }
+                if settings.PARSER_RATE_LIMIT_REDIS_URL:
+                    _limiter = RedisRateLimiter(settings.PARSER_RATE_LIMIT_REDIS_URL, **options)
+                else:
+                    _limiter = MemoryRateLimiter(**options)
+    return _limiter
+
+
+def reset_rate_limiter():
+    """
+    Сбрасывает общий ограничитель в дочернем процессе после fork
+    """
+    global _limiter, _limiter_lock
+    _limiter = None
+    _limiter_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_rate_limiter)
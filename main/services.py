@@ -0,0 +1,68 @@
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from main.models import RefreshCheckpoint
+
+
+def iter_stale_batches(queryset, name, days, number=None, fields=()):
+    """
+    Обходит устаревшие записи queryset (updated старше days дней) пачками
+
+    Записи упорядочены по (updated, id) и выбираются по ключу (keyset pagination)
+     начиная с сохраненной позиции name. Позиция сохраняется до обработки пачки,
+     поэтому записи, которые не удается обновить, не блокируют очередь и
+     повторяются только на следующем круге. Когда записи заканчиваются,
+     обход один раз продолжается с начала и останавливается перед позицией,
+     с которой начался запуск
+
+    :param number: сколько записей обойти, None - все устаревшие записи
+    :param fields: поля, которые нужно получить кроме id и updated
+
+    Возвращает генератор списков словарей
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    batch_size = settings.REFRESH_BATCH_SIZE
+    checkpoint, _ = RefreshCheckpoint.objects.get_or_create(name=name)
+    stale = (
+        queryset.filter(updated__lt=cutoff)
+        .order_by('updated', 'id')
+        .values('id', 'updated', *fields)
+    )
+    # позиция начала запуска: после перехода на начало записи дальше нее уже пройдены
+    start = (checkpoint.last_updated, checkpoint.last_id)
+    wrapped = False
+
+    processed = 0
+    while number is None or processed < number:
+        batch_qs = stale
+        if checkpoint.last_updated is not None:
+            batch_qs = batch_qs.filter(
+                Q(updated__gt=checkpoint.last_updated)
+                | Q(updated=checkpoint.last_updated, id__gt=checkpoint.last_id)
+            )
+        if wrapped:
+            batch_qs = batch_qs.filter(Q(updated__lt=start[0]) | Q(updated=start[0], id__lte=start[1]))
+        size = batch_size if number is None else min(batch_size, number - processed)
+        batch = list(batch_qs[:size])
+
+        if batch:
+            checkpoint.last_updated = batch[-1]['updated']
+            checkpoint.last_id = batch[-1]['id']
+            checkpoint.save()
+            yield batch
+            processed += len(batch)
+            continue
+
+        if wrapped:
+            # дошли до позиции, с которой начался запуск
+            return
+        checkpoint.last_updated = None
+        checkpoint.last_id = None
+        checkpoint.save()
+        if start[0] is None:
+            return
+        # записи закончились: продолжаем с начала
+        wrapped = True
@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище с адресацией по содержимому
+
+    Файл сохраняется под именем sha256 своего содержимого в шардированных
+     каталогах (ab/cd/abcd....jpg), поэтому одинаковые файлы хранятся один раз,
+     а повторное сохранение уже имеющегося файла ничего не записывает
+    """
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    @staticmethod
+    def get_hashed_name(name, content):
+        """
+        Возвращает путь к файлу, построенный по хэшу его содержимого
+        """
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+
+        digest = sha256.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(digest[:2], digest[2:4], digest + extension)
@@ -1,3 +1,79 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from main.models import RefreshCheckpoint
+from main.services import iter_stale_batches
+from products.models import Product
+
+
+@override_settings(REFRESH_BATCH_SIZE=2)
+class IterStaleBatchesTest(TestCase):
+    """
+    Обход устаревших записей по ключу (updated, id) с сохранением позиции
+    """
+    def setUp(self):
+        now = timezone.now()
+        # у первых двух продуктов одинаковое время обновления, последний продукт свежий
+        ages = [30, 30, 20, 10, 0]
+        self.ids = []
+        for i, age in enumerate(ages):
+            product = Product.objects.create(url=f'/product/{i}', title=str(i))
+            Product.objects.filter(pk=product.pk).update(updated=now - datetime.timedelta(days=age))
+            self.ids.append(product.pk)
+        self.stale = self.ids[:4]
+
+    def get_batches(self, number=None):
+        return [
+            [row['id'] for row in batch]
+            for batch in iter_stale_batches(Product.objects.all(), 'products', 5, number)
+        ]
+
+    def get_checkpoint(self):
+        checkpoint = RefreshCheckpoint.objects.get(name='products')
+        return checkpoint.last_updated, checkpoint.last_id
+
+    def test_all(self):
+        self.assertEqual(self.get_batches(), [self.stale[:2], self.stale[2:]])
+        # записи закончились, позиция сброшена на начало
+        self.assertEqual(self.get_checkpoint(), (None, None))
+
+    def test_number(self):
+        self.assertEqual(self.get_batches(3), [self.stale[:2], self.stale[2:3]])
+        self.assertEqual(self.get_checkpoint()[1], self.stale[2])
+
+    def test_resume(self):
+        self.assertEqual(self.get_batches(1), [self.stale[:1]])
+        self.assertEqual(self.get_batches(2), [self.stale[1:3]])
+        # последняя запись и переход на начало
+        self.assertEqual(self.get_batches(2), [self.stale[3:], self.stale[:1]])
+
+    def test_resume_tie(self):
+        # продукты с одинаковым updated различаются по id
+        self.assertEqual(self.get_batches(1), [[self.ids[0]]])
+        self.assertEqual(self.get_batches(1), [[self.ids[1]]])
+
+    def test_checkpoint_saved_before_processing(self):
+        batches = iter_stale_batches(Product.objects.all(), 'products', 5)
+        next(batches)
+        # пачка не обработана (генератор брошен), но следующий запуск продолжит после нее
+        self.assertEqual(self.get_batches(2), [self.stale[2:]])
+
+    def test_wrap(self):
+        self.assertEqual(self.get_batches(4), [self.stale[:2], self.stale[2:]])
+        # позиция в конце: запуск продолжает с начала
+        self.assertEqual(self.get_batches(2), [self.stale[:2]])
+        self.assertEqual(self.get_checkpoint()[1], self.stale[1])
+
+    def test_wrap_stops_at_start(self):
+        self.assertEqual(self.get_batches(3), [self.stale[:2], self.stale[2:3]])
+        # после перехода на начало обход останавливается на позиции начала запуска
+        self.assertEqual(self.get_batches(), [self.stale[3:], self.stale[:2], self.stale[2:3]])
+        self.assertEqual(self.get_checkpoint()[1], self.stale[2])
+
+    def test_refreshed_records_skipped(self):
+        self.assertEqual(self.get_batches(2), [self.stale[:2]])
+        Product.objects.filter(pk=self.stale[2]).update(updated=timezone.now())
+        # обновленная запись пропускается, необновленные повторяются после перехода на начало
+        self.assertEqual(self.get_batches(), [[self.stale[3]], self.stale[:2]])
@@ -1,10 +1,11 @@
 from django.contrib import admin
 
-from .models import ProductNutrition
+from main.admin import CoreModelAdmin
+from .models import ProductNutrition, RecipeNutrition
 
 
 @admin.register(ProductNutrition)
-class ProductNutritionAdmin(admin.ModelAdmin):
+class ProductNutritionAdmin(CoreModelAdmin):
     list_display = [
         '__str__',
         'calories',
@@ -12,3 +13,19 @@ class ProductNutritionAdmin(admin.ModelAdmin):
         'fats',
         'carbohydrates',
     ]
+    list_select_related = ['product']
+    autocomplete_fields = ['product']
+
+
+@admin.register(RecipeNutrition)
+class RecipeNutritionAdmin(CoreModelAdmin):
+    list_display = [
+        '__str__',
+        'calories',
+        'proteins',
+        'fats',
+        'carbohydrates',
+        'calories_per_serving',
+    ]
+    list_select_related = ['recipe']
+    autocomplete_fields = ['recipe']
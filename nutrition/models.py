@@ -2,7 +2,7 @@ from django.db import models
 
 from main.models import CoreModel
 from products.models import Product
-from recipes.models import Recipe
+from recipes.models import NUTRITION_FIELDS, Recipe
 
 
 class Nutrition(CoreModel):
@@ -37,3 +37,40 @@ class ProductNutrition(Nutrition):
 
     def __str__(self):
         return f'Пищевая ценность продукта: {self.product}'
+
+
+class RecipeNutrition(Nutrition):
+    """
+    Пищевая ценность рецепта, пересчитывается при изменении ингредиентов
+     и пищевой ценности входящих в рецепт продуктов (nutrition.services)
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='nutrition',
+    )
+    proteins_per_serving = models.FloatField(
+        'Количество белка на порцию',
+    )
+    fats_per_serving = models.FloatField(
+        'Количество жиров на порцию',
+    )
+    carbohydrates_per_serving = models.FloatField(
+        'Количество углеводов на порцию',
+    )
+    calories_per_serving = models.FloatField(
+        'Количество калорий на порцию',
+    )
+
+    class Meta:
+        verbose_name = 'Пищевая ценность рецепта'
+        verbose_name_plural = 'Пищевая ценность рецептов'
+        # для поиска рецептов по диапазонам значений на порцию с сортировкой (nutrition.services)
+        indexes = [
+            models.Index(fields=[f'{field}_per_serving', 'recipe'], name=f'recipe_{field}_idx')
+            for field in NUTRITION_FIELDS
+        ]
+
+    def __str__(self):
+        return f'Пищевая ценность рецепта: {self.recipe}'
@@ -0,0 +1,177 @@
+import threading
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from nutrition.models import ProductNutrition, RecipeNutrition
+from products.models import Ingredient
+from recipes.models import NUTRITION_FIELDS, Recipe, Tag
+
+# рецепты и продукты, пищевую ценность которых нужно пересчитать после коммита
+_pending = threading.local()
+
+
+def get_pending():
+    if not hasattr(_pending, 'recipe_ids'):
+        _pending.recipe_ids = set()
+        _pending.product_ids = set()
+    return _pending
+
+
+def schedule_recipe_nutrition_update(recipe_ids=(), product_ids=()):
+    """
+    Откладывает пересчет пищевой ценности рецептов до коммита текущей транзакции
+
+    Изменения внутри одной транзакции накапливаются и пересчитываются одним
+     запросом. Вне транзакции пересчет выполняется сразу
+    """
+    pending = get_pending()
+    pending.recipe_ids.update(recipe_ids)
+    pending.product_ids.update(product_ids)
+    transaction.on_commit(flush_recipe_nutrition_updates)
+
+
+def flush_recipe_nutrition_updates():
+    """
+    Пересчитывает пищевую ценность накопленных рецептов
+    """
+    pending = get_pending()
+    recipe_ids, pending.recipe_ids = pending.recipe_ids, set()
+    product_ids, pending.product_ids = pending.product_ids, set()
+
+    if product_ids:
+        recipe_ids.update(
+            Ingredient.objects.filter(product_id__in=product_ids)
+            .values_list('recipe_id', flat=True)
+            .distinct()
+        )
+    if recipe_ids:
+        update_recipe_nutrition(recipe_ids)
+
+
+def update_recipe_nutrition(recipe_ids, batch_size=500):
+    """
+    Пересчитывает пищевую ценность рецептов recipe_ids (всего и на порцию)
+
+    Значения считаются одним агрегатом (Recipe.objects.with_nutrition),
+     а записываются через bulk_update/bulk_create
+    """
+    rows = (
+        Recipe.objects.filter(id__in=recipe_ids)
+        .with_nutrition()
+        .order_by()
+        .values('id', 'serving', *NUTRITION_FIELDS)
+    )
+    existing = RecipeNutrition.objects.in_bulk(recipe_ids, field_name='recipe_id')
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    for row in rows:
+        nutrition = existing.get(row['id']) or RecipeNutrition(recipe_id=row['id'])
+        # bulk_update не заполняет auto_now поля
+        nutrition.updated = now
+        serving = row['serving'] or 1
+        for field in NUTRITION_FIELDS:
+            setattr(nutrition, field, row[field])
+            setattr(nutrition, field + '_per_serving', row[field] / serving)
+
+        if nutrition.pk is None:
+            to_create.append(nutrition)
+        else:
+            to_update.append(nutrition)
+
+    fields = list(NUTRITION_FIELDS) + [f + '_per_serving' for f in NUTRITION_FIELDS] + ['updated']
+    with transaction.atomic():
+        RecipeNutrition.objects.bulk_update(to_update, fields, batch_size=batch_size)
+        RecipeNutrition.objects.bulk_create(to_create, batch_size=batch_size)
+
+
+def calculate_nutrition(plans):
+    """
+    Считает пищевую ценность наборов продуктов (планов питания, пользовательских рецептов)
+
+    :param plans: список наборов, каждый набор - список пар (id продукта, вес в граммах)
+
+    Пищевая ценность всех продуктов загружается одним запросом в матрицу,
+     а суммы по наборам считаются векторно за один проход
+
+    Возвращает (список {calories, proteins, fats, carbohydrates} в порядке plans,
+     множество id продуктов, для которых пищевая ценность неизвестна)
+    """
+    counts = np.fromiter((len(plan) for plan in plans), dtype=np.int64, count=len(plans))
+    items = [item for plan in plans for item in plan]
+    product_ids = np.fromiter((product_id for product_id, _ in items), dtype=np.int64, count=len(items))
+    weights = np.fromiter((weight for _, weight in items), dtype=np.float64, count=len(items))
+
+    # строка матрицы - продукт, столбцы - NUTRITION_FIELDS на 100 г
+    known_ids, rows = np.unique(product_ids, return_inverse=True)
+    matrix = np.zeros((len(known_ids), len(NUTRITION_FIELDS)))
+    found = np.zeros(len(known_ids), dtype=bool)
+    index = {product_id: i for i, product_id in enumerate(known_ids.tolist())}
+    for product_id, *values in ProductNutrition.objects.filter(
+        product_id__in=known_ids.tolist(),
+    ).values_list('product_id', *NUTRITION_FIELDS).iterator():
+        matrix[index[product_id]] = values
+        found[index[product_id]] = True
+
+    # номер набора для каждой пары и вклад пары в пищевую ценность набора
+    plan_index = np.repeat(np.arange(len(plans)), counts)
+    contributions = matrix[rows] * (weights / 100.0)[:, None]
+    totals = np.column_stack([
+        np.bincount(plan_index, weights=contributions[:, i], minlength=len(plans))
+        for i in range(len(NUTRITION_FIELDS))
+    ])
+
+    results = [dict(zip(NUTRITION_FIELDS, row)) for row in totals.tolist()]
+    return results, set(known_ids[~found].tolist())
+
+
+def search_recipes_by_nutrition(ranges=None, tags=(), order='calories', page=1, page_size=20):
+    """
+    Ищет рецепты по пищевой ценности на порцию (RecipeNutrition)
+
+    :param ranges: {поле: (минимум, максимум)}, поле из NUTRITION_FIELDS, границы включаются, None - без границы
+    :param tags: названия тегов, которые должны быть у рецепта (все)
+    :param order: поле сортировки из NUTRITION_FIELDS, "-поле" - по убыванию
+
+    Возвращает {'results': [{'id', 'title', 'nutrition'}], 'page', 'has_next'}
+    """
+    queryset = RecipeNutrition.objects.all()
+    for field, (minimum, maximum) in (ranges or {}).items():
+        if minimum is not None:
+            queryset = queryset.filter(**{f'{field}_per_serving__gte': minimum})
+        if maximum is not None:
+            queryset = queryset.filter(**{f'{field}_per_serving__lte': maximum})
+    if tags:
+        tag_ids = list(Tag.objects.filter(title__in=set(tags)).values_list('id', flat=True))
+        if len(tag_ids) < len(set(tags)):
+            return {'results': [], 'page': page, 'has_next': False}
+        # проверка тега для каждого рецепта идет по уникальному индексу (recipe_id, tag_id),
+        #  поэтому рецепты перебираются в порядке сортировки по индексу пищевой ценности
+        for tag_id in tag_ids:
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(recipe_id=OuterRef('recipe_id'), tag_id=tag_id),
+            ))
+
+    descending = order.startswith('-')
+    order_field = order.lstrip('-') + '_per_serving'
+    queryset = queryset.order_by(
+        ('-' if descending else '') + order_field,
+        ('-' if descending else '') + 'recipe_id',
+    )
+
+    fields = [field + '_per_serving' for field in NUTRITION_FIELDS]
+    offset = (page - 1) * page_size
+    # запрашиваем на одну запись больше, чтобы узнать, есть ли следующая страница
+    rows = list(queryset.values_list('recipe_id', 'recipe__title', *fields)[offset:offset + page_size + 1])
+    return {
+        'results': [
+            {'id': recipe_id, 'title': title, 'nutrition': dict(zip(NUTRITION_FIELDS, values))}
+            for recipe_id, title, *values in rows[:page_size]
+        ],
+        'page': page,
+        'has_next': len(rows) > page_size,
+    }
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from nutrition.models import ProductNutrition
+from nutrition.services import schedule_recipe_nutrition_update
+from products.models import Ingredient
+from recipes.models import NUTRITION_FIELDS, Recipe
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    schedule_recipe_nutrition_update(recipe_ids=[instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # пищевая ценность на порцию зависит от количества порций
+    schedule_recipe_nutrition_update(recipe_ids=[instance.pk])
+
+
+@receiver(pre_save, sender=ProductNutrition)
+def product_nutrition_changing(sender, instance, **kwargs):
+    # при обновлении продукта значения часто не меняются, тогда пересчет рецептов не нужен
+    instance.nutrition_changed = True
+    if instance.pk is None:
+        return
+    old = sender.objects.filter(pk=instance.pk).values(*NUTRITION_FIELDS).first()
+    if old is None:
+        return
+    try:
+        instance.nutrition_changed = any(
+            float(getattr(instance, field)) != old[field] for field in NUTRITION_FIELDS
+        )
+    except (TypeError, ValueError):
+        pass
+
+
+@receiver(post_save, sender=ProductNutrition)
+def product_nutrition_changed(sender, instance, **kwargs):
+    if getattr(instance, 'nutrition_changed', True):
+        schedule_recipe_nutrition_update(product_ids=[instance.product_id])
@@ -1,3 +1,103 @@
+from django.db import transaction
 from django.test import TestCase
 
-# Create your tests here.
+from nutrition.models import ProductNutrition, RecipeNutrition
+from products.models import Ingredient, Product
+from recipes.models import Recipe, RecipeReference
+
+
+def create_recipe(serving=2):
+    reference = RecipeReference.objects.create(url=f'/recipes/{RecipeReference.objects.count()}')
+    return Recipe.objects.create(
+        reference=reference,
+        title='Рецепт',
+        instruction='Инструкция',
+        author='Автор',
+        serving=serving,
+    )
+
+
+def create_product(calories, proteins=0, fats=0, carbohydrates=0):
+    product = Product.objects.create(url=f'/product/{Product.objects.count()}', title='Продукт')
+    ProductNutrition.objects.create(
+        product=product,
+        calories=calories,
+        proteins=proteins,
+        fats=fats,
+        carbohydrates=carbohydrates,
+    )
+    return product
+
+
+class RecipeNutritionUpdateTest(TestCase):
+    """
+    Пересчет пищевой ценности рецептов после коммита (nutrition.signals)
+    """
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe = create_recipe(serving=2)
+            self.product = create_product(calories=100, proteins=10)
+            self.ingredient = Ingredient.objects.create(
+                recipe=self.recipe,
+                product=self.product,
+                measure='г',
+                weight=200,
+            )
+
+    def get_nutrition(self):
+        return RecipeNutrition.objects.get(recipe=self.recipe)
+
+    def test_ingredient_save(self):
+        nutrition = self.get_nutrition()
+        self.assertEqual(nutrition.calories, 200)
+        self.assertEqual(nutrition.proteins, 20)
+        self.assertEqual(nutrition.calories_per_serving, 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.weight = 50
+            self.ingredient.save()
+        self.assertEqual(self.get_nutrition().calories, 50)
+
+    def test_ingredient_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.delete()
+        nutrition = self.get_nutrition()
+        self.assertEqual(nutrition.calories, 0)
+        self.assertEqual(nutrition.calories_per_serving, 0)
+
+    def test_serving_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.serving = 4
+            self.recipe.save()
+        nutrition = self.get_nutrition()
+        self.assertEqual(nutrition.calories, 200)
+        self.assertEqual(nutrition.calories_per_serving, 50)
+
+    def test_product_nutrition_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product_nutrition = ProductNutrition.objects.get(product=self.product)
+            product_nutrition.calories = 300
+            product_nutrition.save()
+        self.assertEqual(self.get_nutrition().calories, 600)
+
+    def test_product_nutrition_unchanged(self):
+        updated = self.get_nutrition().updated
+        with self.captureOnCommitCallbacks() as callbacks:
+            product_nutrition = ProductNutrition.objects.get(product=self.product)
+            # значения из парсера приходят строками
+            product_nutrition.calories = '100'
+            product_nutrition.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.get_nutrition().updated, updated)
+
+    def test_rolled_back_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.ingredient.weight = 1000
+                    self.ingredient.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.get_nutrition().calories, 200)
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from nutrition import views
+
+app_name = 'nutrition'
+
+urlpatterns = [
+    path('calculate/', views.calculate, name='calculate'),
+    path('recipes/', views.recipes_by_nutrition, name='recipes'),
+]
@@ -1,3 +1,137 @@
-from django.shortcuts import render
+import json
+import math
 
-# Create your views here.
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from main.api import MAX_ID, get_positive_int
+from nutrition.services import calculate_nutrition, search_recipes_by_nutrition
+from recipes.models import NUTRITION_FIELDS
+
+
+# наибольший id продукта (bigint)
+MAX_PRODUCT_ID = 2 ** 63 - 1
+
+
+class PlanError(ValueError):
+    pass
+
+
+def is_product_id(value):
+    # bool - подкласс int, а id больше int64 не помещаются в массив numpy
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= MAX_PRODUCT_ID
+
+
+def is_weight(value):
+    # json.loads принимает NaN и Infinity, которые нельзя вернуть в JSON ответа
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+        and 0 <= value <= settings.NUTRITION_MAX_WEIGHT
+    )
+
+
+def parse_plans(data):
+    """
+    Проверяет тело запроса и возвращает наборы в виде списков пар (id продукта, вес)
+    """
+    plans = data.get('plans') if isinstance(data, dict) else None
+    if not isinstance(plans, list):
+        raise PlanError('Ожидается {"plans": [[{"product_id": id, "weight": граммы}, ...], ...]}')
+    if len(plans) > settings.NUTRITION_MAX_PLANS:
+        raise PlanError(f'Не более {settings.NUTRITION_MAX_PLANS} наборов в запросе')
+
+    result = []
+    items = 0
+    for plan in plans:
+        if not isinstance(plan, list):
+            raise PlanError('Набор должен быть списком')
+        items += len(plan)
+        if items > settings.NUTRITION_MAX_ITEMS:
+            raise PlanError(f'Не более {settings.NUTRITION_MAX_ITEMS} продуктов в запросе')
+        pairs = []
+        for item in plan:
+            try:
+                product_id, weight = item['product_id'], item['weight']
+            except (KeyError, TypeError):
+                raise PlanError('Элемент набора: {"product_id": id, "weight": граммы}')
+            if not is_product_id(product_id):
+                raise PlanError('product_id должен быть положительным целым числом')
+            if not is_weight(weight):
+                raise PlanError(f'weight должен быть числом от 0 до {settings.NUTRITION_MAX_WEIGHT}')
+            pairs.append((product_id, weight))
+        result.append(pairs)
+    return result
+
+
+@csrf_exempt
+@require_POST
+def calculate(request):
+    """
+    Пищевая ценность нескольких наборов продуктов за один запрос
+
+    Тело запроса: {"plans": [[{"product_id": 1, "weight": 150}, ...], ...]}
+    Ответ: {"results": [{calories, proteins, fats, carbohydrates}, ...], "missing_products": [...]}
+     в порядке наборов запроса. Продукты без пищевой ценности не учитываются в суммах
+    """
+    try:
+        plans = parse_plans(json.loads(request.body))
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Некорректный JSON'}, status=400)
+    except PlanError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    results, missing = calculate_nutrition(plans)
+    return JsonResponse({'results': results, 'missing_products': sorted(missing)})
+
+
+def get_float(value):
+    """
+    Возвращает число из параметра запроса, None - если параметр не задан
+
+    Если значение не число, выбрасывает ValueError
+    """
+    if value in (None, ''):
+        return None
+    return float(value)
+
+
+@require_GET
+def recipes_by_nutrition(request):
+    """
+    Поиск рецептов по пищевой ценности на порцию
+
+    Параметры запроса:
+     calories_min, calories_max, proteins_min, ... - границы значений на порцию (включительно)
+     tag - название тега, можно указать несколько раз (нужны все теги)
+     order - поле сортировки (calories, proteins, fats, carbohydrates), "-поле" - по убыванию
+     page, page_size - страница результатов и ее размер
+    """
+    try:
+        ranges = {
+            field: (get_float(request.GET.get(field + '_min')), get_float(request.GET.get(field + '_max')))
+            for field in NUTRITION_FIELDS
+        }
+    except ValueError:
+        return JsonResponse({'error': 'Границы должны быть числами'}, status=400)
+
+    order = request.GET.get('order', 'calories')
+    if order.lstrip('-') not in NUTRITION_FIELDS:
+        return JsonResponse({'error': f'Неизвестное поле сортировки: {order}'}, status=400)
+
+    page_size = min(
+        get_positive_int(request.GET.get('page_size'), settings.API_PAGE_SIZE),
+        settings.API_MAX_PAGE_SIZE,
+    )
+    # смещение (page - 1) * page_size должно помещаться в OFFSET
+    page = get_positive_int(request.GET.get('page'), 1, MAX_ID // page_size)
+    return JsonResponse(search_recipes_by_nutrition(
+        ranges={field: bounds for field, bounds in ranges.items() if bounds != (None, None)},
+        tags=request.GET.getlist('tag'),
+        order=order,
+        page=page,
+        page_size=page_size,
+    ))
@@ -1,19 +1,21 @@
 from django.contrib import admin
 
+from main.admin import CoreModelAdmin
 from .models import Product, Ingredient
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CoreModelAdmin):
     list_display = [
         'title',
         'id',
         'updated',
     ]
+    search_fields = ['title']
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(CoreModelAdmin):
     list_display = [
         '__str__',
         'id',
@@ -21,6 +23,8 @@ class IngredientAdmin(admin.ModelAdmin):
         'measure',
         'weight',
     ]
+    list_select_related = ['product', 'recipe']
+    autocomplete_fields = ['recipe', 'product']
     ordering = [
         'product__title',
     ]
@@ -1,161 +1,204 @@
 import datetime
-import re
+from functools import partial
 
-import requests
-from bs4 import BeautifulSoup
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.utils import timezone
 
-from components import services
+from components.services import ComponentParser, DESCRIPTION_XPATH
+from main.batching import CommitWindow
+from main.cache import invalidate_payloads
+from main.extract import Field, Schema, get_attr, get_joined_text, get_tail
+from main.fetch import Fetcher, save_validators_on_commit
+from main.services import iter_stale_batches
 from nutrition.models import ProductNutrition
-from products.models import Product
-from recipes import services
+from products.models import Ingredient, Product
+
+# части url-адресов компонентов
+COMPONENT_PATTERNS = ('/vitamin/', '/element/', '/addon/')
+
+PRODUCT_SCHEMA = Schema(
+    title=Field(css='h1#page-title'),
+    photo_src=Field(
+        css='.field.field-type-filefield.field-field-picture img',
+        getter=get_attr('src'),
+    ),
+    description=Field(
+        css='div.node-content',
+        getter=get_joined_text(DESCRIPTION_XPATH),
+        default='',
+    ),
+    # калории, белки, жиры, углеводы
+    nutrition=Field(
+        css='.fieldgroup.group-base .field-label-inline-first',
+        getter=get_tail,
+        many=True,
+        process=lambda values: values[:4],
+    ),
+    # ссылки из первого блока .node-content
+    component_hrefs=Field(
+        xpath='(//*[contains(concat(" ", normalize-space(@class), " "), " node-content ")])[1]//a',
+        getter=get_attr('href'),
+        many=True,
+    ),
+)
 
 
 class ProductParser:
     """
     Парсер продуктов
     """
-    def __init__(self, product_urls, base_url='https://calorizator.ru'):
-        self.session = requests.Session()
+    def __init__(self, product_urls, base_url='https://calorizator.ru', freshness=None, seen=None):
+        """
+        :param freshness: timedelta, продукты обновленные за этот период не парсятся повторно
+        :param seen: множество url-адресов продуктов, уже обработанных в текущем запуске
+        """
+        self.fetcher = Fetcher()
         self.base_url = base_url
         self.product_urls = product_urls
+        self.freshness = freshness
+        self.seen = seen if seen is not None else set()
+        # компоненты, обработанные за время работы парсера
+        self.seen_components = set()
+        self.window = CommitWindow()
 
     def main(self):
         """
         Основной метод, определяет работу класса
         """
-        for p in self.product_urls:
-            self.parse(p)
-
-    def get_soup(self, url):
+        product_urls = self.get_stale_urls(self.product_urls)
+        self.fetcher.prefetch(product_urls, conditional=True)
+        try:
+            for p in product_urls:
+                self.parse(p)
+                self.seen.add(p)
+        finally:
+            self.window.commit()
+
+    def get_stale_urls(self, product_urls):
         """
-        Возвращает объект BeautifulSoup для заданного url
+        Возвращает url-адреса продуктов, которые нужно парсить:
+         без уже обработанных в текущем запуске и без свежих (обновленных за self.freshness)
         """
-        r = self.session.get(url)
-        return BeautifulSoup(r.text, 'lxml')
+        urls = [u for u in dict.fromkeys(product_urls) if u not in self.seen]
+        if self.freshness and urls:
+            fresh = set(Product.objects.filter(
+                url__in=urls,
+                updated__gte=timezone.now() - self.freshness,
+            ).values_list('url', flat=True))
+            self.seen.update(fresh)
+            urls = [u for u in urls if u not in fresh]
+        return urls
 
     def parse(self, url):
         """
         Парсит страницу продукта и создает объекты Product
         """
-        soup = self.get_soup(url)
+        # отложенные сущности не должны ждать записи все время загрузок этой
+        self.window.commit_if_expired()
+        tree, validators = self.fetcher.get_page(url, conditional=True)
+        if tree is None:
+            # страница не изменилась, достаточно обновить отметку времени продукта
+            if Product.objects.filter(url=url).update(updated=timezone.now()):
+                return
+            tree, validators = self.fetcher.get_page(url)
 
         # парсим необходимые поля
-        title = services.get_text_element(
-            soup,
-            'h1#page-title',
+        data = PRODUCT_SCHEMA.extract(tree)
+        title = data['title']
+        photo_src = data['photo_src']
+        description = data['description']
+        calories, proteins, fats, carbohydrates = data['nutrition']
+
+        # фото и компоненты загружаем до начала транзакции,
+        #  внутри нее компоненты только связываются с продуктом
+        photo = self.fetcher.get_file(photo_src, title + '.jpg')
+        component_urls = self.get_component_urls(data['component_hrefs'])
+        component_parser = ComponentParser(
+            component_urls,
+            freshness=datetime.timedelta(hours=settings.PARSER_COMPONENT_FRESHNESS_HOURS),
+            seen=self.seen_components,
         )
-        photo_src = services.get_image_src(
-            soup,
-            '.field.field-type-filefield.field-field-picture img',
-        )
-        description = self.get_description(
-            soup,
-            'div.node-content',
-        )
-        calories, proteins, fats, carbohydrates = self.get_nutrition(
-            soup,
-            '.fieldgroup.group-base .field-label-inline-first',
+        component_parser.main()
+
+        # продукт и все связанные с ним объекты записываются в одной транзакции
+        #  в окне коммита, когда все загрузки уже выполнены
+        self.window.entity(
+            partial(
+                self.save,
+                url,
+                {
+                    'title': title,
+                    'photo': photo,
+                    'description': description,
+                },
+                {
+                    'calories': calories,
+                    'proteins': proteins,
+                    'fats': fats,
+                    'carbohydrates': carbohydrates,
+                },
+                component_parser,
+                component_urls,
+                validators,
+            ),
+            key=url,
         )
 
+    @staticmethod
+    def save(url, fields, nutrition, component_parser, component_urls, validators):
+        """
+        Создает/обновляет продукт с адресом url, его пищевую ценность и связи с компонентами
+
+        :param fields: значения полей продукта
+        :param nutrition: значения полей пищевой ценности продукта
+        :param validators: валидаторы ответа страницы продукта (Fetcher.get_page)
+        """
         # создаем/обновляем продукт
         product, _ = Product.objects.update_or_create(
             url=url,
-            defaults={
-                'title': title,
-                'photo': ContentFile(
-                    self.session.get(photo_src).content,
-                    name=title + '.jpg',
-                ),
-                'description': description,
-            }
+            defaults=fields,
         )
         # создаем/обновляем пищевую ценность продукта
         ProductNutrition.objects.update_or_create(
             product=product,
-            defaults={
-                'calories': calories,
-                'proteins': proteins,
-                'fats': fats,
-                'carbohydrates': carbohydrates,
-            }
+            defaults=nutrition,
         )
 
-        self.check_components(soup, '/vitamin/', product)
-        self.check_components(soup, '/element/', product)
-        self.check_components(soup, '/addon/', product)
+        if component_urls:
+            component_parser.add_components(product, component_urls)
 
-    def check_components(self, soup, pattern, product=None):
-        """
-        Проверяет наличие компонентов на странице продукте
+        # ответы API продукта и рецептов с ним (название, пищевая ценность ингредиента) устарели
+        invalidate_payloads('product', [product.id])
+        invalidate_payloads('recipe', Ingredient.objects.filter(
+            product=product,
+        ).values_list('recipe_id', flat=True).distinct())
+        # валидаторы страницы сохраняются, только если продукт записан
+        save_validators_on_commit(url, validators)
 
-        Если компоненты присутствуют, то парсит их (ComponentParser)
-         и добавляет к нужному продукту (self.add_components)
+    def get_component_urls(self, hrefs):
+        """
+        За один проход по ссылкам hrefs со страницы продукта возвращает
+         url-адреса компонентов (витаминов, элементов, добавок)
         """
         urls = []
-        content = soup.select_one('.node-content')
-        components = content.find_all('a', href=re.compile(pattern))
-        if components:
-            for c in components:
-                href = c.get('href')
-                if href.startswith('//'):
-                    url = 'https:' + href
-                else:
-                    url = self.base_url + href
-                urls.append(url)
-
-            if product:
-                component_parser = services.ComponentParser(urls, product=product)
-                component_parser.main()
+        for href in hrefs:
+            if not href or not any(pattern in href for pattern in COMPONENT_PATTERNS):
+                continue
+            if href.startswith('//'):
+                url = 'https:' + href
+            else:
+                url = self.base_url + href
+            urls.append(url)
         return urls
 
-    @staticmethod
-    def add_components(product, component_urls):
-        """
-        К соответствующему продукту добавляет компоненты
-        """
-        components = []
-        c1 = component_urls[0]
-        if '/vitamin/' in c1:
-            product.vitamin_set.add(*components)
-        elif '/element/' in c1.url:
-            product.element_set_set.add(*components)
-        elif '/addon/' in c1.url:
-            product.addon_set_set.add(*components)
-
-    @staticmethod
-    def get_description(soup, selector):
-        """
-        Из объекта BeautifulSoup возвращает описание продукта
-        """
-        description = ''
-        description_elems = soup.select_one(selector).find_all(re.compile('h3|p'))
-        for d in description_elems:
-            description += d.text
-        return description
-
-    @staticmethod
-    def get_nutrition(soup, selector):
-        """
-        Из объекта BeautifulSoup возвращает пищевую ценность продукта (калории, белки, жиры, углеводы)
-        """
-        nutrition_elems = soup.select(selector)
-        calories = nutrition_elems[0].next_sibling.strip()
-        proteins = nutrition_elems[1].next_sibling.strip()
-        fats = nutrition_elems[2].next_sibling.strip()
-        carbohydrates = nutrition_elems[3].next_sibling.strip()
-        return calories, proteins, fats, carbohydrates
-
 
 def update_products(number, days):
     """
     Обновляет информацию о продуктах
 
-    :param number: количество элементов обновляемых за один раз
+    :param number: количество элементов обновляемых за один раз, None - все устаревшие
     :param days: количество дней с последнего обновления
     """
-    products = Product.objects.filter(
-        updated__lt=datetime.datetime.now() - datetime.timedelta(days=days)
-    )[:number].values_list('url', flat=True)
-    parser = ProductParser(products)
-    parser.main()
+    for batch in iter_stale_batches(Product.objects.all(), 'products', days, number, ['url']):
+        parser = ProductParser([p['url'] for p in batch])
+        parser.main()
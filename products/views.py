@@ -1,3 +1,45 @@
-from django.shortcuts import render
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from components.models import Addon, Element, Vitamin
+from main.api import ApiField, Serializer, detail_view, get_file_url, get_related_updated, list_view
+from products.models import Product
+from recipes.views import get_nutrition
+
+
+def get_components(components):
+    return [{'id': c.id, 'title': c.title} for c in components.all()]
+
+
+PRODUCT_SERIALIZER = Serializer(
+    id=ApiField(lambda p: p.id),
+    url=ApiField(lambda p: p.url),
+    title=ApiField(lambda p: p.title),
+    description=ApiField(lambda p: p.description),
+    photo=ApiField(lambda p: get_file_url(p.photo)),
+    # пищевая ценность на 100 г
+    nutrition=ApiField(lambda p: get_nutrition(getattr(p, 'nutrition', None)), select_related=['nutrition']),
+    vitamins=ApiField(lambda p: get_components(p.vitamin_set), prefetch_related=['vitamin_set']),
+    elements=ApiField(lambda p: get_components(p.element_set), prefetch_related=['element_set']),
+    addons=ApiField(lambda p: get_components(p.addon_set), prefetch_related=['addon_set']),
+    created=ApiField(lambda p: p.created),
+    updated=ApiField(lambda p: p.updated),
+)
+
+# в версию входит время обновления пищевой ценности и компонентов, которые есть в ответе
+PRODUCT_VERSION_FIELDS = (
+    'updated',
+    'nutrition__updated',
+    get_related_updated(Vitamin.products.through, 'product', 'vitamin__updated'),
+    get_related_updated(Element.products.through, 'product', 'element__updated'),
+    get_related_updated(Addon.products.through, 'product', 'addon__updated'),
+)
+
+
+@require_GET
+def product_list(request):
+    return list_view(request, Product.objects.all(), PRODUCT_SERIALIZER, PRODUCT_VERSION_FIELDS, 'product')
+
+
+@require_GET
+def product_detail(request, pk):
+    return detail_view(request, Product.objects.all(), PRODUCT_SERIALIZER, pk, PRODUCT_VERSION_FIELDS, 'product')
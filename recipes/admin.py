@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from main.admin import CoreModelAdmin
 from .models import (
     Recipe,
     RecipePhotoStep,
@@ -9,30 +10,34 @@ from .models import (
 
 
 @admin.register(RecipeReference)
-class RecipeReferenceAdmin(admin.ModelAdmin):
+class RecipeReferenceAdmin(CoreModelAdmin):
     list_display = [
         'id',
         'url',
         'is_parsed',
+        'dispatched',
     ]
+    search_fields = ['url']
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(CoreModelAdmin):
     list_display = [
         '__str__',
         'id',
         'created',
         'updated',
     ]
-    filter_horizontal = ['tags']
+    search_fields = ['title']
+    autocomplete_fields = ['reference', 'tags']
 
 
 @admin.register(RecipePhotoStep)
-class RecipePhotoStepAdmin(admin.ModelAdmin):
-    pass
+class RecipePhotoStepAdmin(CoreModelAdmin):
+    list_select_related = ['recipe']
+    autocomplete_fields = ['recipe']
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    pass
+    search_fields = ['title']
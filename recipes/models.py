@@ -1,7 +1,12 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
 
 from main.models import CoreModel
 
+# поля пищевой ценности
+NUTRITION_FIELDS = ('calories', 'proteins', 'fats', 'carbohydrates')
+
 
 class RecipeReference(CoreModel):
     url = models.CharField(
@@ -13,6 +18,11 @@ class RecipeReference(CoreModel):
         'Парсинг выполнен',
         default=False,
     )
+    dispatched = models.DateTimeField(
+        'Передана воркерам',
+        blank=True,
+        null=True,
+    )
 
     class Meta:
         verbose_name = 'Ссылка на рецепт'
@@ -22,6 +32,24 @@ class RecipeReference(CoreModel):
         return f'Ссылка на рецепт: {self.url}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_nutrition(self):
+        """
+        Добавляет к рецептам пищевую ценность (calories, proteins, fats, carbohydrates),
+         посчитанную одним SQL-агрегатом по ингредиентам
+        """
+        return self.annotate(**{
+            field: Coalesce(
+                Sum(ExpressionWrapper(
+                    F(f'ingredient__product__nutrition__{field}') * F('ingredient__weight') / 100.0,
+                    output_field=models.FloatField(),
+                )),
+                0.0,
+            )
+            for field in NUTRITION_FIELDS
+        })
+
+
 class Recipe(CoreModel):
     reference = models.OneToOneField(
         RecipeReference,
@@ -60,6 +88,8 @@ class Recipe(CoreModel):
         upload_to='recipes/Recipe/',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
@@ -69,23 +99,24 @@ class Recipe(CoreModel):
         return self.title
 
     def get_nutrition(self):
-        ingredients = self.ingredient_set.all()
-        calories = 0
-        proteins = 0
-        fats = 0
-        carbohydrates = 0
-        for i in ingredients:
-            calories += i.product.nutrition.calories * i.weight / 100
-            proteins += i.product.nutrition.protein * i.weight / 100
-            fats += i.product.nutrition.fat * i.weight / 100
-            carbohydrates += i.product.nutrition.carbohydrates * i.weight / 100
-        return calories, proteins, fats, carbohydrates
+        """
+        Возвращает пищевую ценность рецепта (калории, белки, жиры, углеводы)
+
+        Если рецепт получен через Recipe.objects.with_nutrition(), значения берутся
+         из аннотаций без дополнительных запросов, иначе - из RecipeNutrition
+        """
+        if all(hasattr(self, field) for field in NUTRITION_FIELDS):
+            return tuple(getattr(self, field) for field in NUTRITION_FIELDS)
+        if hasattr(self, 'nutrition'):
+            return tuple(getattr(self.nutrition, field) for field in NUTRITION_FIELDS)
+        return Recipe.objects.with_nutrition().values_list(*NUTRITION_FIELDS).get(pk=self.pk)
 
 
 class Tag(CoreModel):
     title = models.CharField(
         'Название',
         max_length=100,
+        unique=True,
     )
     photo = models.ImageField(
         'Фото',
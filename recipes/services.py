@@ -1,14 +1,30 @@
 import datetime
-import re
-import requests
-
-from bs4 import BeautifulSoup
-from django.core.files.base import ContentFile
-
+import logging
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from lxml import etree
+
+from main.batching import CommitWindow
+from main.cache import invalidate_payloads
+from main.extract import Field, Schema, get_attr, get_raw_text, get_text
+from main.fetch import Fetcher, save_validators_on_commit
+from main.services import iter_stale_batches
+from main.utils import chunked
+from nutrition.services import schedule_recipe_nutrition_update
 from products.models import Ingredient, Product
 from products.services import ProductParser
 from recipes.models import RecipeReference, RecipePhotoStep, Recipe, Tag
 
+logger = logging.getLogger(__name__)
+
+# id тегов по названию, общий для всех парсеров процесса
+tag_cache = {}
+
 
 def get_text_element(soup, selector):
     """
@@ -36,147 +52,239 @@ def get_image_src(soup, selector):
     return src
 
 
+def get_photo_step(element):
+    """
+    Из ссылки галереи возвращает пункт рецепта (название, ссылка на фото)
+    """
+    return element.find('.//img').get('alt'), element.get('href')
+
+
+def get_ingredient_row(element):
+    """
+    Из строки таблицы ингредиентов возвращает кортеж (ссылка на продукт, мера, вес)
+    """
+    cells = element.xpath('./td')
+    return element.find('.//a').get('href'), get_text(cells[1]), get_text(cells[2])
+
+
+RECIPE_SCHEMA = Schema(
+    title=Field(css='h1#page-title'),
+    instruction=Field(css='div[itemprop="recipeInstructions"] ol'),
+    description=Field(css='div[itemprop="description"] p'),
+    author=Field(css='div.recipes-author span'),
+    serving=Field(css='span[itemprop="recipeYield"]'),
+    photo_src=Field(
+        css='.field.field-type-filefield.field-field-picture img',
+        getter=get_attr('src'),
+    ),
+    card_src=Field(
+        css='p.recipes-card img',
+        getter=get_attr('src'),
+    ),
+    photo_steps=Field(
+        css='#galleria a',
+        getter=get_photo_step,
+        many=True,
+    ),
+    ingredients=Field(
+        css='#ar_tabl tbody tr',
+        getter=get_ingredient_row,
+        many=True,
+    ),
+    tags=Field(
+        css='#recipes-col2 a',
+        getter=get_raw_text,
+        many=True,
+    ),
+)
+
+
 class RecipeReferencesCrawler:
     """
     Сбор ссылок на рецепты
+
+    Карты сайта разбираются потоково, а ссылки сохраняются пачками по batch_size,
+     поэтому расход памяти не зависит от размера карты сайта
     """
-    def __init__(self, limit=10, base_url='https://calorizator.ru'):
+    def __init__(self, limit=10, base_url='https://calorizator.ru', batch_size=1000):
         self.limit = limit
         self.base_url = base_url
-        self.session = requests.Session()
+        self.batch_size = batch_size
+        self.fetcher = Fetcher()
 
     def main(self):
         """
         Основной метод, определяет работу класса
         """
-        page_urls = self.get_sitemap_pages(self.base_url + 'sitemap.xml')
+        page_urls = list(self.get_sitemap_pages(self.base_url + '/sitemap.xml'))
         urls = self.crawl_recipes(page_urls, self.limit)
-        for url in urls:
-            RecipeReference.objects.get_or_create(url=url)
+        for chunk in chunked(urls, self.batch_size):
+            RecipeReference.objects.bulk_create(
+                [RecipeReference(url=url) for url in chunk],
+                ignore_conflicts=True,
+            )
 
-    def get_soup(self, url):
+    def iter_locs(self, url):
         """
-        Возвращает объект BeautifulSoup для заданного url
+        Потоково разбирает xml карты сайта и по одному возвращает пары
+         (имя родительского тега, значение тега loc)
+
+        Обработанные элементы удаляются из дерева, поэтому в памяти хранится
+         только текущая запись карты сайта
         """
-        r = self.session.get(url)
-        return BeautifulSoup(r.text, 'lxml')
+        response = self.fetcher.request(url, stream=True)
+        response.raw.decode_content = True
+        try:
+            for _, elem in etree.iterparse(response.raw, events=('end',)):
+                tag = etree.QName(elem).localname
+                if tag == 'loc' and elem.text:
+                    yield etree.QName(elem.getparent()).localname, elem.text.strip()
+                elif tag in ('url', 'sitemap'):
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+        finally:
+            response.close()
 
     def get_sitemap_pages(self, sitemap_url):
         """
-        Возвращает список url-адресов страниц с карты сайта
+        Возвращает генератор url-адресов страниц с карты сайта
         """
-        soup = self.get_soup(sitemap_url)
-        sitemap_page_elems = soup.select('sitemap>loc')
-        sitemap_page_urls = [item.text.strip() for item in sitemap_page_elems]
-        return sitemap_page_urls
+        for parent, loc in self.iter_locs(sitemap_url):
+            if parent == 'sitemap':
+                yield loc
 
     def crawl_recipes(self, page_urls, limit=None):
         """
-        Обходит страницы карты сайта, собирает url-адреса рецептов и возвращает их в виде списка
+        Обходит страницы карты сайта и возвращает генератор url-адресов рецептов
 
-        :param limit: ограничивает количество рецептов
+        :param limit: ограничивает количество рецептов с одной страницы карты сайта
         :param page_urls: список url-адресов страниц с карты сайта
         """
-        urls = []
-
         for url in page_urls:
-            soup = self.get_soup(url)
-            recipes = soup.find_all(text=re.compile('recipes'), limit=limit)
-            urls.extend(recipes)
-        return urls
+            recipes = (loc for _, loc in self.iter_locs(url) if 'recipes' in loc)
+            yield from islice(recipes, limit)
 
 
 class RecipeParser:
     """
     Парсер рецептов
     """
-    def __init__(self, reference_list, base_url='https://calorizator.ru'):
+    def __init__(self, reference_list, base_url='https://calorizator.ru', chunk_size=50, skip_errors=False):
+        """
+        :param skip_errors: не прерывать работу при ошибке парсинга рецепта,
+         а сохранять ссылку и ошибку в self.errors
+        """
         self.reference_list = reference_list
         self.base_url = base_url
-        self.session = requests.Session()
+        self.chunk_size = chunk_size
+        self.skip_errors = skip_errors
+        self.errors = []
+        self.window = CommitWindow(on_error=self.on_write_error if skip_errors else None)
+        self.fetcher = Fetcher()
+        # продукты, обработанные за время работы парсера
+        self.seen_products = set()
 
     def main(self):
         """
         Основной метод, определяет работу класса
         """
-        for r in self.reference_list:
-            self.parse(r)
-
-    def get_soup(self, url):
+        try:
+            for chunk in chunked(self.reference_list, self.chunk_size):
+                # страницы рецептов пачки загружаем параллельно
+                self.fetcher.prefetch((r.url for r in chunk), conditional=True)
+                for r in chunk:
+                    try:
+                        self.parse(r)
+                    except Exception as e:
+                        if not self.skip_errors:
+                            raise
+                        logger.exception('Ошибка парсинга рецепта %s', r.url)
+                        self.errors.append((r, e))
+        finally:
+            self.window.commit()
+
+    def on_write_error(self, reference, error):
         """
-        Возвращает объект BeautifulSoup для заданного url
+        Сохраняет ошибку записи рецепта, отложенной в окне коммита
         """
-        r = self.session.get(url)
-        soup = BeautifulSoup(r.text, 'lxml')
-        return soup
+        logger.error('Ошибка записи рецепта %s', reference.url, exc_info=error)
+        self.errors.append((reference, error))
 
     def parse(self, reference):
         """
         Парсит страницу рецепта, создает объект рецепта и связанные с ним объекты
         """
-        soup = self.get_soup(reference.url)
+        # отложенные сущности не должны ждать записи все время загрузок этой
+        self.window.commit_if_expired()
+        tree, validators = self.fetcher.get_page(reference.url, conditional=True)
+        if tree is None:
+            # страница не изменилась, достаточно обновить отметку времени рецепта
+            if Recipe.objects.filter(reference=reference).update(updated=timezone.now()):
+                return
+            tree, validators = self.fetcher.get_page(reference.url)
 
         # парсим необходимые атрибуты
-        title = get_text_element(
-            soup,
-            'h1#page-title',
-        )
-        instruction = get_text_element(
-            soup,
-            'div[itemprop="recipeInstructions"] ol',
-        )
-        description = get_text_element(
-            soup,
-            'div[itemprop="description"] p',
-        )
-        author = get_text_element(
-            soup,
-            'div.recipes-author span',
-        )
-        serving = get_text_element(
-            soup,
-            'span[itemprop="recipeYield"]',
-        )
-        photo_src = get_image_src(
-            soup,
-            '.field.field-type-filefield.field-field-picture img',
-        )
-        card_src = get_image_src(
-            soup,
-            'p.recipes-card img',
-        )
-        photo_steps = self.get_photo_steps(
-            soup,
-            '#galleria a',
-        )
+        data = RECIPE_SCHEMA.extract(tree)
+        title = data['title']
+        photo_src = data['photo_src']
+        card_src = data['card_src']
         ingredients = self.get_ingredients(
-            soup,
-            '#ar_tabl tbody tr',
+            data['ingredients'],
             ProductParser,
         )
         tags = self.get_tags(
-            soup,
-            '#recipes-col2 a',
+            data['tags'],
+        )
+
+        # продукты могли загружаться долго
+        self.window.commit_if_expired()
+        # изображения рецепта загружаем параллельно и до начала транзакции
+        self.fetcher.prefetch(
+            [photo_src, card_src] + [href for _, href in data['photo_steps']],
+            conditional=True,
+        )
+        photo = self.fetcher.get_file(photo_src, title + '.jpg')
+        card = self.fetcher.get_file(card_src, 'card_' + title + '.jpg')
+        photo_steps = [
+            (step_title, self.fetcher.get_file(href, step_title + '.jpg'))
+            for step_title, href in data['photo_steps']
+        ]
+
+        # рецепт и все связанные с ним объекты записываются в одной транзакции
+        #  в окне коммита, когда все загрузки уже выполнены
+        self.window.entity(
+            partial(
+                self.save,
+                reference,
+                {
+                    'title': title,
+                    'instruction': data['instruction'],
+                    'description': data['description'],
+                    'author': data['author'],
+                    'serving': data['serving'],
+                    'photo': photo,
+                    'card': card,
+                },
+                tags,
+                photo_steps,
+                ingredients,
+                validators,
+            ),
+            key=reference,
         )
 
+    def save(self, reference, fields, tags, photo_steps, ingredients, validators):
+        """
+        Создает/обновляет рецепт со ссылкой reference и связанные с ним объекты
+
+        :param fields: значения полей рецепта
+        :param validators: валидаторы ответа страницы рецепта (Fetcher.get_page)
+        """
         # Создаем/обновляем рецепт
         recipe, _ = Recipe.objects.update_or_create(
             reference=reference,
-            defaults={
-                'title': title,
-                'instruction': instruction,
-                'description': description,
-                'author': author,
-                'serving': serving,
-                'photo': ContentFile(
-                    self.session.get(photo_src).content,
-                    name=title + '.jpg',
-                ),
-                'card': ContentFile(
-                    self.session.get(card_src).content,
-                    name='card_' + title + '.jpg',
-                ),
-            }
+            defaults=fields,
         )
         # Добавляем теги к рецепту
         recipe.tags.add(*tags)
@@ -192,22 +300,25 @@ class RecipeParser:
             recipe,
             ingredients,
         )
+        # ответ API рецепта устарел
+        invalidate_payloads('recipe', [recipe.id])
         reference.is_parsed = True
         reference.save()
+        # валидаторы страницы сохраняются, только если рецепт записан
+        save_validators_on_commit(reference.url, validators)
 
-    def set_photo_steps(self, recipe, step_list):
+    @staticmethod
+    def set_photo_steps(recipe, step_list):
         """
-        Добавляет к рецепту recipe пошаговую инструкцию с фото из step_list
+        Добавляет к рецепту recipe пошаговую инструкцию из step_list
+         (название пункта, имя сохраненного фото)
         """
-        for title, href in step_list:
+        for title, photo in step_list:
             RecipePhotoStep.objects.update_or_create(
                 recipe=recipe,
                 title=title,
                 defaults={
-                    'photo': ContentFile(
-                        self.session.get(href).content,
-                        name=title + '.jpg',
-                    ),
+                    'photo': photo,
                 }
             )
 
@@ -216,85 +327,136 @@ class RecipeParser:
         """
         Создает объекты Ingredient для списка recipe на основе полученного
          списка ингредиентов ingredient_list
-        """
-        for i in ingredient_list:
-            product_url, measure, weight = i
-            product = Product.objects.get(url=product_url)
-            Ingredient.objects.update_or_create(
-                recipe=recipe,
-                product=product,
-                defaults={
-                    'measure': measure,
-                    'weight': weight,
-                }
-            )
 
-    def get_ingredients(self, soup, selector, parser=None):
+        Продукты получаются одним запросом, ингредиенты сравниваются с уже
+         сохраненными и записываются пачкой в одной транзакции. Ингредиенты,
+         которых больше нет в рецепте, удаляются
         """
-        Из объекта BeautifulSoup возвращает список кортежей с описанием ингредиентов
-         по заданному селектору selector
+        product_ids = dict(
+            Product.objects.filter(
+                url__in={product_url for product_url, _, _ in ingredient_list},
+            ).values_list('url', 'id')
+        )
+        rows = {}
+        for product_url, measure, weight in ingredient_list:
+            if product_url not in product_ids:
+                raise Product.DoesNotExist(f'Продукт {product_url} не найден')
+            rows[product_ids[product_url]] = (measure, float(weight))
+
+        existing = {i.product_id: i for i in Ingredient.objects.filter(recipe=recipe)}
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for product_id, (measure, weight) in rows.items():
+            ingredient = existing.pop(product_id, None)
+            if ingredient is None:
+                to_create.append(Ingredient(
+                    recipe=recipe,
+                    product_id=product_id,
+                    measure=measure,
+                    weight=weight,
+                ))
+            elif ingredient.measure != measure or ingredient.weight != weight:
+                ingredient.measure = measure
+                ingredient.weight = weight
+                ingredient.updated = now
+                to_update.append(ingredient)
+
+        with transaction.atomic():
+            if existing:
+                Ingredient.objects.filter(pk__in=[i.pk for i in existing.values()]).delete()
+            Ingredient.objects.bulk_update(to_update, ['measure', 'weight', 'updated'])
+            Ingredient.objects.bulk_create(to_create)
+
+            # bulk-операции не отправляют сигналы, поэтому пересчет пищевой ценности запускаем сами
+            if to_create or to_update or existing:
+                schedule_recipe_nutrition_update(recipe_ids=[recipe.pk])
+
+    def get_ingredients(self, rows, parser=None):
+        """
+        Из строк таблицы ингредиентов (ссылка на продукт, мера, вес) возвращает
+         список кортежей с описанием ингредиентов
         """
         ingredient_list = []
         product_urls = []
 
-        ingredient_elems = soup.select(selector)
-        for ingredient in ingredient_elems:
-            product_url = self.base_url + ingredient.select_one('a').get('href')
-            measure = ingredient.contents[3].text.strip()
-            weight = ingredient.contents[5].text.strip()
+        for href, measure, weight in rows:
+            product_url = self.base_url + href
 
             product_urls.append(product_url)
             ingredient_list.append((product_url, measure, weight))
 
         # парсим продукты
         if parser:
-            p = ProductParser(product_urls)
+            p = parser(
+                product_urls,
+                base_url=self.base_url,
+                freshness=datetime.timedelta(hours=settings.PARSER_PRODUCT_FRESHNESS_HOURS),
+                seen=self.seen_products,
+            )
             p.main()
         return ingredient_list
 
     @staticmethod
-    def get_photo_steps(soup, selector):
-        """
-        Из объекта BeautifulSoup возвращает список фотографий (src) пунктов рецепта
-         по заданному селектору selector
+    def get_tags(titles):
         """
-        steps = []
-        step_elems = soup.select(selector)
-        for e in step_elems:
-            title = e.select_one('img').get('alt')
-            href = e.get('href')
-            steps.append((title, href))
-        return steps
+        Создает по необходимости объекты Tag для списка названий тегов titles
 
-    @staticmethod
-    def get_tags(soup, selector):
+        Возвращает список id тегов, соответствующих полученным названиям.
+        Id тегов кэшируются в процессе, недостающие теги создаются одним запросом.
+        Тег могли удалить, переименовать или объединить с другим в админке,
+         поэтому id из кэша проверяются тем же запросом, которым ищутся недостающие теги
         """
-        Из объекта BeautifulSoup получает список тегов для рецепта по заданному селектору selector
-        Создает по необходимости объекты Tag на основе полученных тегов
+        titles = list(dict.fromkeys(titles))
+        cached_ids = [tag_cache[t] for t in titles if t in tag_cache]
+        missing = [t for t in titles if t not in tag_cache]
+        found = dict(
+            Tag.objects.filter(Q(id__in=cached_ids) | Q(title__in=missing)).values_list('title', 'id')
+        )
+        for title in titles:
+            if found.get(title) is None:
+                tag_cache.pop(title, None)
+            else:
+                tag_cache[title] = found[title]
 
-        Возвращает список объектов Tag соответствующих полученным тегам
-        """
-        tags = []
-        tag_elems = soup.select(selector)
+        missing = [t for t in titles if t not in tag_cache]
+        if missing:
+            # ignore_conflicts: тег мог создать параллельно другой воркер
+            Tag.objects.bulk_create([Tag(title=t) for t in missing], ignore_conflicts=True)
+            tag_cache.update(Tag.objects.filter(title__in=missing).values_list('title', 'id'))
+        return [tag_cache[t] for t in titles]
 
-        for t in tag_elems:
-            tag, _ = Tag.objects.get_or_create(
-                title=t.text,
-            )
-            tags.append(tag)
-        return tags
+
+def dispatch_references(number):
+    """
+    Выбирает не больше number неразобранных ссылок, которые еще не розданы воркерам
+     (или розданы больше PARSER_DISPATCH_TIMEOUT_MINUTES минут назад), и отмечает их розданными
+
+    Выбор и отметка выполняются в одной транзакции, поэтому параллельные запуски
+     получают разные ссылки
+    """
+    now = timezone.now()
+    expired = now - datetime.timedelta(minutes=settings.PARSER_DISPATCH_TIMEOUT_MINUTES)
+    with transaction.atomic():
+        reference_ids = list(
+            RecipeReference.objects.select_for_update(skip_locked=True)
+            .filter(Q(dispatched__isnull=True) | Q(dispatched__lt=expired), is_parsed=False)
+            .order_by('id')
+            .values_list('id', flat=True)[:number]
+        )
+        RecipeReference.objects.filter(id__in=reference_ids).update(dispatched=now)
+    return reference_ids
 
 
 def update_recipes(number, days):
     """
     Обновляет рецепты
 
-    :param number: количество элементов обновляемых за один раз
+    :param number: количество элементов обновляемых за один раз, None - все устаревшие
     :param days: количество дней с последнего обновления
     """
-    recipes = Recipe.objects.filter(
-        updated__lt=datetime.datetime.now() - datetime.timedelta(days=days)
-    )[:number]
-    references = recipes.values_list('reference__url', flat=True)
-    parser = RecipeParser(references)
-    parser.main()
+    batches = iter_stale_batches(Recipe.objects.all(), 'recipes', days, number, ['reference_id'])
+    for batch in batches:
+        references = RecipeReference.objects.filter(id__in=[r['reference_id'] for r in batch])
+        parser = RecipeParser(references)
+        parser.main()
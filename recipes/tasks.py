@@ -1,12 +1,19 @@
-from celery import shared_task
+from collections import Counter
 
+from celery import chord, shared_task
+from celery.utils.log import get_task_logger
+
+from main.utils import chunked
 from recipes.models import RecipeReference
 from .services import (
     RecipeParser,
     RecipeReferencesCrawler,
+    dispatch_references,
     update_recipes
 )
 
+logger = get_task_logger(__name__)
+
 
 # сбор ссылок на рецепты
 @shared_task(bind=True)
@@ -15,12 +22,47 @@ def crawl_references(self, number):
     crawler.main()
 
 
-# парсинг рецептов
+# парсинг рецептов: делит неразобранные ссылки на пачки и раздает их воркерам
+# ссылки отмечаются как розданные, поэтому повторный запуск, пока пачки еще в очереди,
+#  не раздает их второй раз
+@shared_task(bind=True)
+def parse_recipes_task(self, number, chunk_size=20):
+    reference_ids = dispatch_references(number)
+    if not reference_ids:
+        return None
+
+    header = [
+        parse_recipes_chunk_task.s(chunk)
+        for chunk in chunked(reference_ids, chunk_size)
+    ]
+    return chord(header)(report_parsed_recipes_task.s()).id
+
+
+# парсинг пачки рецептов
+# уже разобранные к моменту выполнения ссылки пропускаются, поэтому задачу можно повторять
 @shared_task(bind=True)
-def parse_recipes_task(self, number):
-    references = RecipeReference.objects.filter(is_parsed=False)[:number]
-    parser = RecipeParser(references)
+def parse_recipes_chunk_task(self, reference_ids):
+    references = list(RecipeReference.objects.filter(id__in=reference_ids, is_parsed=False))
+    parser = RecipeParser(references, skip_errors=True)
     parser.main()
+    return {
+        'parsed': len(references) - len(parser.errors),
+        'failed': len(parser.errors),
+        'skipped': len(reference_ids) - len(references),
+    }
+
+
+# итог парсинга рецептов по всем пачкам
+@shared_task
+def report_parsed_recipes_task(results):
+    totals = Counter()
+    for result in results:
+        totals.update(result)
+    logger.info(
+        'Парсинг рецептов завершен: разобрано %s, с ошибкой %s, пропущено %s',
+        totals['parsed'], totals['failed'], totals['skipped'],
+    )
+    return dict(totals)
 
 
 # обновление рецептов
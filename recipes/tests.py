@@ -1,3 +1,137 @@
 from django.test import TestCase
 
-# Create your tests here.
+from nutrition.models import ProductNutrition, RecipeNutrition
+from products.models import Ingredient, Product
+from recipes.models import Recipe, RecipeReference, Tag
+from recipes.services import RecipeParser, tag_cache
+
+
+class SetIngredientsTest(TestCase):
+    """
+    Запись ингредиентов рецепта (RecipeParser.set_ingredients)
+    """
+    def setUp(self):
+        reference = RecipeReference.objects.create(url='/recipes/1')
+        self.recipe = Recipe.objects.create(
+            reference=reference,
+            title='Рецепт',
+            instruction='Инструкция',
+            author='Автор',
+            serving=1,
+        )
+        for slug, calories in (('salt', 0), ('beet', 40), ('milk', 60)):
+            product = Product.objects.create(url=f'/product/{slug}', title=slug)
+            ProductNutrition.objects.create(
+                product=product,
+                calories=calories,
+                proteins=0,
+                fats=0,
+                carbohydrates=0,
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeParser.set_ingredients(self.recipe, [
+                ('/product/salt', '1 ч.л.', '5'),
+                ('/product/beet', '1 шт', '200'),
+            ])
+
+    def get_ingredients(self):
+        return {
+            product_url: (measure, weight)
+            for product_url, measure, weight in Ingredient.objects.filter(
+                recipe=self.recipe,
+            ).values_list('product__url', 'measure', 'weight')
+        }
+
+    def get_calories(self):
+        return RecipeNutrition.objects.get(recipe=self.recipe).calories
+
+    def test_create(self):
+        self.assertEqual(self.get_ingredients(), {
+            '/product/salt': ('1 ч.л.', 5),
+            '/product/beet': ('1 шт', 200),
+        })
+        self.assertEqual(self.get_calories(), 80)
+
+    def test_add(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeParser.set_ingredients(self.recipe, [
+                ('/product/salt', '1 ч.л.', '5'),
+                ('/product/beet', '1 шт', '200'),
+                ('/product/milk', '1 стакан', '250'),
+            ])
+        self.assertEqual(self.get_ingredients()['/product/milk'], ('1 стакан', 250))
+        self.assertEqual(self.get_calories(), 230)
+
+    def test_change(self):
+        salt = Ingredient.objects.get(recipe=self.recipe, product__url='/product/salt')
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeParser.set_ingredients(self.recipe, [
+                ('/product/salt', '1 ч.л.', '5'),
+                ('/product/beet', '2 шт', '400'),
+            ])
+        self.assertEqual(self.get_ingredients()['/product/beet'], ('2 шт', 400))
+        self.assertEqual(self.get_calories(), 160)
+        # неизмененный ингредиент не перезаписывается
+        self.assertEqual(Ingredient.objects.get(pk=salt.pk).updated, salt.updated)
+
+    def test_remove(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeParser.set_ingredients(self.recipe, [
+                ('/product/salt', '1 ч.л.', '5'),
+            ])
+        self.assertEqual(list(self.get_ingredients()), ['/product/salt'])
+        self.assertEqual(self.get_calories(), 0)
+
+    def test_unchanged(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            RecipeParser.set_ingredients(self.recipe, [
+                ('/product/salt', '1 ч.л.', '5'),
+                ('/product/beet', '1 шт', '200'),
+            ])
+        # без изменений пищевая ценность не пересчитывается
+        self.assertEqual(callbacks, [])
+
+    def test_missing_product(self):
+        with self.assertRaises(Product.DoesNotExist):
+            RecipeParser.set_ingredients(self.recipe, [
+                ('/product/salt', '1 ч.л.', '10'),
+                ('/product/unknown', '1 шт', '100'),
+            ])
+        # ингредиенты рецепта не изменились
+        self.assertEqual(self.get_ingredients(), {
+            '/product/salt': ('1 ч.л.', 5),
+            '/product/beet': ('1 шт', 200),
+        })
+
+
+class GetTagsTest(TestCase):
+    """
+    Получение id тегов через кэш процесса (RecipeParser.get_tags)
+    """
+    def setUp(self):
+        tag_cache.clear()
+
+    def test_create(self):
+        soup = Tag.objects.create(title='Супы')
+        ids = RecipeParser.get_tags(['Супы', 'Обед', 'Супы'])
+        self.assertEqual(ids, [soup.id, Tag.objects.get(title='Обед').id])
+        self.assertEqual(tag_cache, {'Супы': ids[0], 'Обед': ids[1]})
+
+    def test_cached(self):
+        ids = RecipeParser.get_tags(['Супы', 'Обед'])
+        with self.assertNumQueries(1):
+            self.assertEqual(RecipeParser.get_tags(['Обед', 'Супы']), ids[::-1])
+
+    def test_deleted_tag(self):
+        old_id, = RecipeParser.get_tags(['Супы'])
+        Tag.objects.filter(id=old_id).delete()
+        new_id, = RecipeParser.get_tags(['Супы'])
+        self.assertNotEqual(new_id, old_id)
+        self.assertEqual(Tag.objects.get(title='Супы').id, new_id)
+
+    def test_renamed_tag(self):
+        old_id, = RecipeParser.get_tags(['Супы'])
+        Tag.objects.filter(id=old_id).update(title='Первые блюда')
+        new_id, = RecipeParser.get_tags(['Супы'])
+        self.assertNotEqual(new_id, old_id)
+        self.assertEqual(Tag.objects.get(title='Супы').id, new_id)
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from recipes import views
+
+app_name = 'recipes'
+
+urlpatterns = [
+    path('', views.recipe_list, name='recipe_list'),
+    path('<int:pk>/', views.recipe_detail, name='recipe_detail'),
+]
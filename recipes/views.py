@@ -1,3 +1,89 @@
-from django.shortcuts import render
+from django.db.models import Prefetch
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from main.api import ApiField, Serializer, detail_view, get_file_url, get_related_updated, list_view
+from products.models import Ingredient
+from recipes.models import NUTRITION_FIELDS, Recipe, RecipePhotoStep
+
+
+def get_nutrition(nutrition, suffix=''):
+    """
+    Возвращает пищевую ценность {calories, proteins, fats, carbohydrates}, либо None
+    """
+    if nutrition is None:
+        return None
+    return {field: getattr(nutrition, field + suffix) for field in NUTRITION_FIELDS}
+
+
+def get_recipe_nutrition(recipe):
+    nutrition = getattr(recipe, 'nutrition', None)
+    if nutrition is None:
+        return None
+    return {
+        'total': get_nutrition(nutrition),
+        'per_serving': get_nutrition(nutrition, '_per_serving'),
+    }
+
+
+def get_ingredients(recipe):
+    return [
+        {
+            'product_id': ingredient.product_id,
+            'product': ingredient.product.title,
+            'measure': ingredient.measure,
+            'weight': ingredient.weight,
+            # пищевая ценность продукта на 100 г
+            'nutrition': get_nutrition(getattr(ingredient.product, 'nutrition', None)),
+        }
+        for ingredient in recipe.ingredient_set.all()
+    ]
+
+
+RECIPE_SERIALIZER = Serializer(
+    id=ApiField(lambda r: r.id),
+    url=ApiField(lambda r: r.reference.url, select_related=['reference']),
+    title=ApiField(lambda r: r.title),
+    description=ApiField(lambda r: r.description),
+    instruction=ApiField(lambda r: r.instruction),
+    author=ApiField(lambda r: r.author),
+    serving=ApiField(lambda r: r.serving),
+    photo=ApiField(lambda r: get_file_url(r.photo)),
+    card=ApiField(lambda r: get_file_url(r.card)),
+    tags=ApiField(lambda r: [tag.title for tag in r.tags.all()], prefetch_related=['tags']),
+    steps=ApiField(
+        lambda r: [{'title': s.title, 'photo': get_file_url(s.photo)} for s in r.recipephotostep_set.all()],
+        prefetch_related=['recipephotostep_set'],
+    ),
+    ingredients=ApiField(
+        get_ingredients,
+        prefetch_related=[Prefetch(
+            'ingredient_set',
+            queryset=Ingredient.objects.select_related('product__nutrition').order_by('id'),
+        )],
+    ),
+    nutrition=ApiField(get_recipe_nutrition, select_related=['nutrition']),
+    created=ApiField(lambda r: r.created),
+    updated=ApiField(lambda r: r.updated),
+)
+
+# в версию входит время обновления всего, что есть в ответе: пищевая ценность
+#  пересчитывается отдельно от рецепта, а продукты и теги обновляются сами по себе
+RECIPE_VERSION_FIELDS = (
+    'updated',
+    'nutrition__updated',
+    get_related_updated(Ingredient, 'recipe'),
+    get_related_updated(Ingredient, 'recipe', 'product__updated'),
+    get_related_updated(Ingredient, 'recipe', 'product__nutrition__updated'),
+    get_related_updated(Recipe.tags.through, 'recipe', 'tag__updated'),
+    get_related_updated(RecipePhotoStep, 'recipe'),
+)
+
+
+@require_GET
+def recipe_list(request):
+    return list_view(request, Recipe.objects.all(), RECIPE_SERIALIZER, RECIPE_VERSION_FIELDS, 'recipe')
+
+
+@require_GET
+def recipe_detail(request, pk):
+    return detail_view(request, Recipe.objects.all(), RECIPE_SERIALIZER, pk, RECIPE_VERSION_FIELDS, 'recipe')
@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_search_index(sender, **kwargs):
+    from search.services import create_search_index
+    create_search_index()
+
+
+class SearchConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'search'
+
+    def ready(self):
+        from search import signals  # noqa: F401
+        # таблицы индекса не описываются моделями, они создаются после миграций
+        post_migrate.connect(create_search_index, sender=self)
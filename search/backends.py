@@ -0,0 +1,138 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from main.utils import chunked
+from search.text import normalize, stem
+
+# веса столбцов при ранжировании в SQLite (bm25), соответствуют весам A-D PostgreSQL
+BM25_WEIGHTS = {'A': 10.0, 'B': 5.0, 'C': 2.0, 'D': 1.0}
+
+
+class SQLiteSearchIndex:
+    """
+    Полнотекстовый индекс на FTS5
+
+    В FTS5 нет русского стеммера, поэтому текст документов и запросов
+     приводится к основам слов заранее (search.text.normalize),
+     а rowid таблицы совпадает с id объекта
+    """
+    # запросы вида "слово*" ищут по префиксу, для коротких префиксов строится отдельный индекс
+    CREATE_SQL = (
+        'CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5('
+        "{columns}, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+    def create(self, table, columns):
+        with connection.cursor() as cursor:
+            cursor.execute(self.CREATE_SQL.format(table=table, columns=', '.join(columns)))
+
+    def update(self, table, columns, documents, batch_size=500):
+        """
+        Добавляет или заменяет документы: [(id, {столбец: текст})]
+        """
+        sql = 'INSERT INTO {table} (rowid, {columns}) VALUES (%s, {params})'.format(
+            table=table,
+            columns=', '.join(columns),
+            params=', '.join(['%s'] * len(columns)),
+        )
+        with connection.cursor() as cursor:
+            for chunk in chunked(documents, batch_size):
+                self.delete_rows(cursor, table, [pk for pk, _ in chunk])
+                cursor.executemany(
+                    sql,
+                    [[pk] + [normalize(document[c]) for c in columns] for pk, document in chunk],
+                )
+
+    def delete(self, table, ids):
+        with connection.cursor() as cursor:
+            self.delete_rows(cursor, table, ids)
+
+    @staticmethod
+    def delete_rows(cursor, table, ids):
+        for chunk in chunked(ids, 500):
+            cursor.execute(
+                f'DELETE FROM {table} WHERE rowid IN ({", ".join(["%s"] * len(chunk))})',
+                chunk,
+            )
+
+    def clear(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+
+    def search(self, table, columns, words, limit, offset=0):
+        """
+        Возвращает [(id, ранг)] документов, содержащих все слова words (search.text.tokenize)
+         по префиксу основы, по убыванию ранга
+        """
+        query = ' '.join(f'"{stem(word)}"*' for word in words)
+        weights = ', '.join(str(BM25_WEIGHTS[weight]) for weight in columns.values())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, -bm25({table}, {weights}) AS rank FROM {table} '
+                f'WHERE {table} MATCH %s ORDER BY rank DESC, rowid LIMIT %s OFFSET %s',
+                [query, limit, offset],
+            )
+            return cursor.fetchall()
+
+
+class PostgreSQLSearchIndex:
+    """
+    Полнотекстовый индекс на tsvector с GIN-индексом
+
+    Основы слов выделяет сам PostgreSQL (конфигурация russian)
+    """
+    CONFIG = 'russian'
+
+    def create(self, table, columns):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} (id bigint PRIMARY KEY, document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_document ON {table} USING GIN (document)')
+
+    def update(self, table, columns, documents, batch_size=500):
+        document = ' || '.join(
+            f"setweight(to_tsvector('{self.CONFIG}', %s), '{weight}')" for weight in columns.values()
+        )
+        sql = (
+            f'INSERT INTO {table} (id, document) VALUES (%s, {document}) '
+            f'ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document'
+        )
+        with connection.cursor() as cursor:
+            for chunk in chunked(documents, batch_size):
+                cursor.executemany(sql, [[pk] + [document[c] for c in columns] for pk, document in chunk])
+
+    def delete(self, table, ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE id = ANY(%s)', [list(ids)])
+
+    def clear(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {table}')
+
+    def search(self, table, columns, words, limit, offset=0):
+        query = ' & '.join(f'{word}:*' for word in words)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, ts_rank_cd(document, query) AS rank '
+                f"FROM {table}, to_tsquery('{self.CONFIG}', %s) query "
+                f'WHERE document @@ query ORDER BY rank DESC, id LIMIT %s OFFSET %s',
+                [query, limit, offset],
+            )
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchIndex,
+    'postgresql': PostgreSQLSearchIndex,
+}
+
+
+def get_search_index():
+    """
+    Возвращает полнотекстовый индекс для текущей базы данных
+    """
+    try:
+        return BACKENDS[connection.vendor]()
+    except KeyError:
+        raise ImproperlyConfigured(f'Полнотекстовый поиск не поддерживается для {connection.vendor}')
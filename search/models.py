@@ -0,0 +1,2 @@
+# Таблицы полнотекстового индекса зависят от базы данных (FTS5 или tsvector),
+#  поэтому не описываются моделями и создаются в search.services.create_search_index
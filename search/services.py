@@ -0,0 +1,178 @@
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from main.utils import chunked
+from products.models import Product
+from recipes.models import Recipe
+from search.backends import get_search_index
+from search.text import tokenize
+
+# типы документов: модель, таблица индекса и столбцы с весом при ранжировании (A - наибольший)
+DOCUMENTS = {
+    'recipe': {
+        'model': Recipe,
+        'table': 'search_recipe',
+        'columns': {'title': 'A', 'tags': 'B', 'description': 'C', 'instruction': 'D'},
+    },
+    'product': {
+        'model': Product,
+        'table': 'search_product',
+        'columns': {'title': 'A', 'description': 'D'},
+    },
+}
+
+# объекты, которые нужно переиндексировать после коммита
+_pending = threading.local()
+
+
+def get_pending():
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = {kind: set() for kind in DOCUMENTS}
+        _pending.tag_ids = set()
+    return _pending
+
+
+def create_search_index():
+    """
+    Создает таблицы полнотекстового индекса, если их еще нет
+    """
+    index = get_search_index()
+    for document in DOCUMENTS.values():
+        index.create(document['table'], document['columns'])
+
+
+def schedule_search_update(kind=None, ids=(), tag_ids=()):
+    """
+    Откладывает переиндексацию объектов до коммита текущей транзакции
+
+    :param kind: тип документа (ключ DOCUMENTS)
+    :param ids: id объектов, которые изменились или были удалены
+    :param tag_ids: id тегов, рецепты с которыми нужно переиндексировать
+    """
+    pending = get_pending()
+    if kind is not None:
+        pending.ids[kind].update(ids)
+    pending.tag_ids.update(tag_ids)
+    transaction.on_commit(flush_search_updates)
+
+
+def flush_search_updates():
+    """
+    Переиндексирует накопленные объекты
+    """
+    pending = get_pending()
+    ids, pending.ids = pending.ids, {kind: set() for kind in DOCUMENTS}
+    tag_ids, pending.tag_ids = pending.tag_ids, set()
+
+    if tag_ids:
+        ids['recipe'].update(
+            Recipe.tags.through.objects.filter(tag_id__in=tag_ids).values_list('recipe_id', flat=True)
+        )
+    for kind, kind_ids in ids.items():
+        if kind_ids:
+            update_search_index(kind, kind_ids)
+
+
+def get_recipe_documents(recipe_ids):
+    """
+    Возвращает [(id, {столбец: текст})] рецептов recipe_ids
+    """
+    tags = {}
+    for recipe_id, title in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids,
+    ).values_list('recipe_id', 'tag__title'):
+        tags.setdefault(recipe_id, []).append(title)
+
+    rows = Recipe.objects.filter(id__in=recipe_ids).order_by().values_list(
+        'id', 'title', 'description', 'instruction',
+    )
+    return [
+        (pk, {
+            'title': title,
+            'tags': ' '.join(tags.get(pk, ())),
+            'description': description or '',
+            'instruction': instruction,
+        })
+        for pk, title, description, instruction in rows
+    ]
+
+
+def get_product_documents(product_ids):
+    """
+    Возвращает [(id, {столбец: текст})] продуктов product_ids
+    """
+    rows = Product.objects.filter(id__in=product_ids).order_by().values_list('id', 'title', 'description')
+    return [(pk, {'title': title, 'description': description}) for pk, title, description in rows]
+
+
+DOCUMENT_GETTERS = {
+    'recipe': get_recipe_documents,
+    'product': get_product_documents,
+}
+
+
+def update_search_index(kind, ids):
+    """
+    Переиндексирует объекты ids, удаленные объекты убираются из индекса
+    """
+    table = DOCUMENTS[kind]['table']
+    columns = DOCUMENTS[kind]['columns']
+    index = get_search_index()
+    for chunk in chunked(ids, settings.SEARCH_BATCH_SIZE):
+        documents = DOCUMENT_GETTERS[kind](chunk)
+        with transaction.atomic():
+            index.delete(table, set(chunk) - {pk for pk, _ in documents})
+            index.update(table, columns, documents)
+
+
+def rebuild_search_index(kinds=None):
+    """
+    Строит индекс заново для всех объектов типов kinds (по умолчанию - всех типов)
+    """
+    create_search_index()
+    index = get_search_index()
+    for kind in kinds or DOCUMENTS:
+        document = DOCUMENTS[kind]
+        index.clear(document['table'])
+        ids = document['model'].objects.order_by('id').values_list('id', flat=True)
+        for chunk in chunked(ids.iterator(), settings.SEARCH_BATCH_SIZE):
+            with transaction.atomic():
+                index.update(document['table'], document['columns'], DOCUMENT_GETTERS[kind](chunk))
+
+
+def search(query, kind='recipe', page=1, page_size=None):
+    """
+    Ищет объекты типа kind по словам запроса query
+
+    Найденные объекты содержат все слова запроса (с учетом словоформ и по префиксу)
+     и отсортированы по релевантности
+
+    Возвращает {'results': [{'id', 'title', 'rank'}], 'page', 'has_next'}
+    """
+    page_size = page_size or settings.SEARCH_PAGE_SIZE
+    # однобуквенные слова (предлоги, союзы) по префиксу совпадают почти со всеми документами
+    words = [word for word in tokenize(query) if len(word) > 1]
+    if not words:
+        return {'results': [], 'page': page, 'has_next': False}
+
+    document = DOCUMENTS[kind]
+    # запрашиваем на одну запись больше, чтобы узнать, есть ли следующая страница
+    rows = get_search_index().search(
+        document['table'],
+        document['columns'],
+        words,
+        limit=page_size + 1,
+        offset=(page - 1) * page_size,
+    )
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+
+    titles = dict(document['model'].objects.filter(id__in=[pk for pk, _ in rows]).values_list('id', 'title'))
+    results = [
+        {'id': pk, 'title': titles[pk], 'rank': rank}
+        for pk, rank in rows
+        if pk in titles
+    ]
+    return {'results': results, 'page': page, 'has_next': has_next}
@@ -0,0 +1,31 @@
+import re
+from functools import lru_cache
+
+import snowballstemmer
+
+# слова: последовательности букв и цифр
+WORD_RE = re.compile(r'[^\W_]+')
+
+_stemmer = snowballstemmer.stemmer('russian')
+
+
+def tokenize(text):
+    """
+    Разбивает текст на слова в нижнем регистре
+    """
+    return WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """
+    Возвращает основу слова (русский стеммер Snowball)
+    """
+    return _stemmer.stemWord(word)
+
+
+def normalize(text):
+    """
+    Приводит слова текста к основам
+    """
+    return ' '.join(stem(word) for word in tokenize(text))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from main.api import MAX_ID, get_positive_int
+from search.services import DOCUMENTS, search
+
+
+@require_GET
+def search_view(request):
+    """
+    Полнотекстовый поиск
+
+    Параметры запроса:
+     q - строка поиска
+     type - тип объектов (recipe, product), по умолчанию recipe
+     page, page_size - страница результатов и ее размер
+    """
+    kind = request.GET.get('type', 'recipe')
+    if kind not in DOCUMENTS:
+        return JsonResponse({'error': f'Неизвестный тип: {kind}'}, status=400)
+
+    page_size = min(
+        get_positive_int(request.GET.get('page_size'), settings.SEARCH_PAGE_SIZE),
+        settings.SEARCH_MAX_PAGE_SIZE,
+    )
+    # смещение (page - 1) * page_size должно помещаться в OFFSET
+    page = get_positive_int(request.GET.get('page'), 1, MAX_ID // page_size)
+    return JsonResponse(search(request.GET.get('q', ''), kind, page, page_size))